@@ -0,0 +1,116 @@
+import hashlib
+import hmac
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from fastapi import HTTPException
+
+@dataclass
+class ApiKey:
+    name: str
+    digest: bytes
+    scopes: tuple[str, ...]
+    rate: float  # requests per second, 0 = unlimited
+    burst: float
+    _tokens: float = field(default=0.0, repr=False)
+    _updated: float = field(default=0.0, repr=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def __post_init__(self):
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+
+    def allows(self, scope: str) -> bool:
+        for granted in self.scopes:
+            if granted == "*" or granted == scope:
+                return True
+            if granted.endswith(":*") and scope.startswith(granted[:-1]):
+                return True
+        return False
+
+    def take(self) -> float:
+        """Token bucket; returns 0 if the request may proceed, else seconds until it could."""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+def _digest(key: str) -> bytes:
+    # Fixed-length digests let compare_digest run in constant time regardless of input length
+    return hashlib.sha256(key.encode()).digest()
+
+_keys: list[ApiKey] = []
+
+def _float_env(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, "") or default)
+    except ValueError:
+        return default
+
+def reload_keys() -> int:
+    """Load API keys from HS_API_KEY (full access) and HS_API_KEYS (JSON list of named keys)."""
+    global _keys
+    # Unlimited unless configured: existing clients share the master key and may poll often
+    rate = _float_env("HS_API_RATE_LIMIT", 0)
+    burst = _float_env("HS_API_RATE_BURST", rate * 2)
+    keys = []
+    legacy = os.getenv("HS_API_KEY") or ""
+    if legacy:
+        keys.append(ApiKey("default", _digest(legacy), ("*",), rate, burst))
+    raw = os.getenv("HS_API_KEYS") or ""
+    if raw.strip() and raw.strip() != "null":
+        try:
+            items = json.loads(raw)
+            if not isinstance(items, list):
+                raise TypeError(f"expected a JSON list, got {type(items).__name__}")
+            for item in items:
+                if not isinstance(item, dict):
+                    raise TypeError(f"expected objects with name/key/scopes, got {item!r:.40}")
+                if not item.get("key"):
+                    continue
+                item_rate = float(item.get("rate_limit") or rate)
+                keys.append(ApiKey(
+                    name=item.get("name") or f"key{len(keys)}",
+                    digest=_digest(item["key"]),
+                    scopes=tuple(item.get("scopes") or ("*",)),
+                    rate=item_rate,
+                    burst=float(item.get("burst") or item_rate * 2),
+                ))
+        except (ValueError, TypeError) as e:
+            # Refuse to start rather than silently run with only the master key
+            raise RuntimeError(f"Invalid HS_API_KEYS (api_keys option): {e}") from e
+    _keys = keys
+    return len(keys)
+
+reload_keys()
+
+def _find(presented: str) -> ApiKey | None:
+    digest = _digest(presented)
+    found = None
+    # Compare against every key so timing doesn't reveal which one matched
+    for key in _keys:
+        if hmac.compare_digest(digest, key.digest):
+            found = key
+    return found
+
+def require_api_key(x_api_key: str | None, scope: str | None = "*") -> ApiKey:
+    """Authenticate, authorize scope (None: caller checks) and rate-limit; raises 403 or 429."""
+    key = _find(x_api_key) if x_api_key else None
+    if key is None or (scope is not None and not key.allows(scope)):
+        raise HTTPException(status_code=403, detail="Forbidden")
+    wait = key.take()
+    if wait:
+        raise HTTPException(
+            status_code=429,
+            detail="Rate limit exceeded",
+            headers={"Retry-After": str(max(1, int(wait + 0.999)))},
+        )
+    return key
@@ -0,0 +1,81 @@
+import asyncio
+import json
+from typing import Any, AsyncIterator
+
+from storage import add_listener
+
+class TokenEvents:
+    """Fan-out of token writes to asyncio subscribers.
+
+    Each subscriber is just a bounded queue on the event loop, so hundreds of
+    idle streams cost a few objects each and no threads. publish() may be
+    called from any thread; a subscriber that falls behind loses its oldest
+    events rather than blocking writers.
+    """
+
+    def __init__(self, queue_size: int = 16):
+        self.queue_size = queue_size
+        self._subscribers: set[tuple[asyncio.AbstractEventLoop, asyncio.Queue, asyncio.Event, str, str | None]] = set()
+
+    def __len__(self) -> int:
+        return len(self._subscribers)
+
+    def publish(self, provider: str, label: str, payload: dict[str, Any]) -> None:
+        event = {
+            "provider": provider,
+            "label": label,
+            "type": "token" if payload.get("access_token") else "cleared",
+            "expiry": payload.get("expiry"),
+            "token_type": payload.get("token_type", "Bearer"),
+        }
+        for loop, queue, _, sub_provider, only in list(self._subscribers):
+            if sub_provider == provider and (only is None or only == label):
+                try:
+                    loop.call_soon_threadsafe(self._offer, queue, event)
+                except RuntimeError:
+                    pass  # loop already closed
+
+    @staticmethod
+    def _offer(queue: asyncio.Queue, event: dict) -> None:
+        if queue.full():
+            queue.get_nowait()
+        queue.put_nowait(event)
+
+    def close(self) -> None:
+        """End every open stream, e.g. at shutdown so the server isn't left waiting on them."""
+        for loop, _, closing, _, _ in list(self._subscribers):
+            try:
+                loop.call_soon_threadsafe(closing.set)
+            except RuntimeError:
+                pass  # loop already closed
+
+    async def subscribe(self, provider: str, label: str | None, heartbeat: float = 15) -> AsyncIterator[str]:
+        """Yield SSE frames for writes to provider's label (all its labels if None) until closed or cancelled."""
+        queue: asyncio.Queue = asyncio.Queue(self.queue_size)
+        closing = asyncio.Event()
+        sub = (asyncio.get_running_loop(), queue, closing, provider, label)
+        self._subscribers.add(sub)
+        closed = asyncio.ensure_future(closing.wait())
+        get = None
+        try:
+            yield ": connected\n\n"
+            while True:
+                get = asyncio.ensure_future(queue.get())
+                done, _ = await asyncio.wait({get, closed}, timeout=heartbeat, return_when=asyncio.FIRST_COMPLETED)
+                if get not in done:
+                    get.cancel()
+                    if closed in done:
+                        return
+                    # Comment frames keep proxies from closing idle streams
+                    yield ": ping\n\n"
+                    continue
+                event = get.result()
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            closed.cancel()
+            if get is not None:
+                get.cancel()
+            self._subscribers.discard(sub)
+
+token_events = TokenEvents()
+add_listener(token_events.publish)
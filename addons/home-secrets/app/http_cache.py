@@ -0,0 +1,29 @@
+import hashlib
+import secrets
+from fastapi import Request, Response
+
+# Keyed per process so an ETag can't be used to brute-force the secret it covers
+_ETAG_KEY = secrets.token_bytes(16)
+
+def etag_for(*parts) -> str:
+    """Strong ETag for a response whose content is fully determined by parts."""
+    data = "\x1f".join(str(p) for p in parts).encode()
+    digest = hashlib.blake2b(data, key=_ETAG_KEY, digest_size=12).hexdigest()
+    return f'"{digest}"'
+
+def _matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # Weak comparison, as RFC 9110 requires for If-None-Match
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+def cached(request: Request, response: Response, etag: str, cache_control: str) -> Response | None:
+    """Set validator headers on response; return a 304 to send instead if the client is current."""
+    headers = {"ETag": etag, "Cache-Control": cache_control, "Vary": "X-API-Key"}
+    if _matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
@@ -0,0 +1,183 @@
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from fastapi import APIRouter, Header
+from fastapi.responses import PlainTextResponse
+
+from auth import require_api_key
+
+# Off by default: every recording call returns immediately and neither the
+# middleware nor /metrics is installed.
+ENABLED = os.getenv("HS_METRICS_ENABLED", "false").lower() == "true"
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0)
+
+_lock = threading.Lock()
+_registry: list["_Metric"] = []
+_NULL = nullcontext()
+
+def _key(labels: dict[str, str]) -> tuple:
+    return tuple(sorted(labels.items()))
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _fmt_labels(key: tuple, extra: tuple = ()) -> str:
+    pairs = key + extra
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        _registry.append(self)
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str):
+        super().__init__(name, help)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        if not ENABLED:
+            return
+        key = _key(labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        with _lock:
+            for key, value in self._values.items():
+                lines.append(f"{self.name}{_fmt_labels(key)} {value}")
+        return lines
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, help)
+        self.buckets = buckets
+        # per label set: [count per bucket..., +Inf count, sum]
+        self._values: dict[tuple, list[float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        if not ENABLED:
+            return
+        key = _key(labels)
+        with _lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    row[i] += 1
+                    break
+            else:
+                row[len(self.buckets)] += 1
+            row[-1] += value
+
+    def time(self, **labels: str):
+        """Context manager observing the elapsed wall time of its block."""
+        if not ENABLED:
+            return _NULL
+        return self._timer(labels)
+
+    @contextmanager
+    def _timer(self, labels: dict[str, str]):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        with _lock:
+            for key, row in self._values.items():
+                cumulative = 0
+                for bound, n in zip(self.buckets, row):
+                    cumulative += n
+                    lines.append(f"{self.name}_bucket{_fmt_labels(key, (('le', bound),))} {cumulative}")
+                cumulative += row[len(self.buckets)]
+                lines.append(f"{self.name}_bucket{_fmt_labels(key, (('le', '+Inf'),))} {cumulative}")
+                lines.append(f"{self.name}_sum{_fmt_labels(key)} {row[-1]}")
+                lines.append(f"{self.name}_count{_fmt_labels(key)} {cumulative}")
+        return lines
+
+def render() -> str:
+    lines: list[str] = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+# Metrics recorded across the app
+http_requests = Counter("hs_http_requests_total", "HTTP requests by route, method and status")
+http_latency = Histogram("hs_http_request_seconds", "HTTP request latency by route and method")
+storage_latency = Histogram("hs_storage_seconds", "Token storage operation latency")
+token_endpoint_latency = Histogram("hs_oauth_token_request_seconds", "Outbound OAuth token endpoint POST latency by provider")
+refresh_outcomes = Counter("hs_token_refresh_total", "Access token refreshes by provider and outcome")
+refresh_lead = Histogram(
+    "hs_token_refresh_lead_seconds",
+    "Seconds left before expiry when the background refresher renewed a token",
+    buckets=(0, 30, 60, 120, 300, 600, 1200, 3600),
+)
+
+class MetricsMiddleware:
+    """ASGI middleware recording per-route request counts and latency."""
+
+    def __init__(self, app):
+        self.app = app
+        self._paths: dict = {}
+
+    def _route(self, scope) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        path = self._paths.get(endpoint)
+        if path is None:
+            # Label by path template, not the raw path, to keep cardinality bounded
+            for route in scope["app"].routes:
+                if getattr(route, "endpoint", None) is endpoint:
+                    path = route.path
+                    break
+            else:
+                path = getattr(endpoint, "__name__", "unknown")
+            self._paths[endpoint] = path
+        return path
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = self._route(scope)
+            method = scope["method"]
+            http_latency.observe(time.perf_counter() - start, route=route, method=method)
+            http_requests.inc(route=route, method=method, status=str(status["code"]))
+
+router = APIRouter()
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def get_metrics(x_api_key: str | None = Header(default=None)):
+    # Label names of stored tokens show up in the series, so scraping needs a key too
+    require_api_key(x_api_key, "metrics")
+    return PlainTextResponse(render(), media_type="text/plain; version=0.0.4")
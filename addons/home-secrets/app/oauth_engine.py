@@ -0,0 +1,473 @@
+import os
+import time
+import asyncio
+import secrets
+import httpx
+import logging
+from collections import OrderedDict
+from urllib.parse import urlencode
+from fastapi import APIRouter, HTTPException, Request, Response, Header
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from storage import add_listener, token_get, token_set, token_update
+from state_store import states
+from auth import require_api_key
+from http_cache import cached, etag_for
+from events import token_events
+from metrics import token_endpoint_latency, refresh_outcomes
+from oauth_providers import Provider, get_provider
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+def _now() -> int:
+    return int(time.time())
+
+# One pooled client for every provider's token endpoint (httpx pools per
+# host); opened and closed by the app lifespan, created lazily if used
+# outside of it.
+_client: httpx.AsyncClient | None = None
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+def _http() -> httpx.AsyncClient:
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            timeout=20,
+            http2=_http2_available(),
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10, keepalive_expiry=120),
+            # GitHub answers form-encoded unless asked for JSON
+            headers={"Accept": "application/json"},
+        )
+    return _client
+
+async def open_client() -> None:
+    _http()
+
+async def close_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+_flights: dict[str, asyncio.Future] = {}
+
+async def _single_flight(key: str, fn):
+    """Run fn once per key at a time; concurrent callers await and share its result or error."""
+    while (flight := _flights.get(key)) is not None:
+        try:
+            return await asyncio.shield(flight)
+        except asyncio.CancelledError:
+            # Only our own cancellation propagates; if the leader was cancelled, lead a new flight
+            if not flight.cancelled() or asyncio.current_task().cancelling():
+                raise
+    flight = _flights[key] = asyncio.get_running_loop().create_future()
+    try:
+        result = await fn()
+    except asyncio.CancelledError:
+        flight.cancel()
+        raise
+    except BaseException as e:
+        flight.set_exception(e)
+        flight.exception()  # mark retrieved; waiters still see it
+        raise
+    else:
+        flight.set_result(result)
+        return result
+    finally:
+        _flights.pop(key, None)
+
+def _expiry(tok: dict):
+    # Tokens without expires_in (GitHub OAuth apps) don't expire: expiry None
+    expires_in = tok.get("expires_in")
+    return _now() + int(expires_in) - 30 if expires_in else None  # 30s skew
+
+async def _post_token(provider: Provider, data: dict) -> tuple[httpx.Response, dict]:
+    with token_endpoint_latency.time(provider=provider.name, grant=data["grant_type"]):
+        r = await _http().post(provider.token_url, data=data)
+    try:
+        tok = r.json()
+    except ValueError:
+        tok = {}
+    return r, tok
+
+@router.get("/oauth/{provider}/start")
+def oauth_start(
+    provider: str,
+    redirect_uri: str,
+    x_api_key: str | None = Header(default=None),
+    api_key: str | None = None
+):
+    p = get_provider(provider)
+    # Support API key from both header and query parameter
+    api_key_to_use = x_api_key or api_key
+    label = p.default_label
+    require_api_key(api_key_to_use, f"{p.name}:{label}")
+
+    if not p.client_id:
+        raise HTTPException(500, f"Missing {p.env_prefix}_CLIENT_ID")
+
+    # Validate that redirect_uri was provided
+    if not redirect_uri:
+        raise HTTPException(400, "redirect_uri parameter is required")
+
+    state = secrets.token_urlsafe(24)
+    # Store ephemeral state along with redirect_uri for validation
+    states.put(state, {"provider": p.name, "label": label, "ts": _now(), "redirect_uri": redirect_uri})
+    params = {
+        "client_id": p.client_id,
+        "response_type": "code",
+        "redirect_uri": redirect_uri,
+        "scope": " ".join(p.scopes),
+        **p.auth_params,
+        "state": state,
+    }
+    return {"authorize_url": f"{p.auth_url}?{urlencode(params)}"}
+
+@router.get("/oauth/{provider}/callback")
+async def oauth_callback(provider: str, code: str, state: str):
+    p = get_provider(provider)
+
+    # Validate state (single use, expires after HS_OAUTH_STATE_TTL_SECONDS)
+    ctx = states.pop(state)
+    # Flows started before the provider registry carry no provider and were Google's
+    if not ctx or ctx.get("provider", "google") != p.name:
+        raise HTTPException(400, "Invalid state")
+
+    label = ctx.get("label") or p.default_label
+    redirect_uri = ctx.get("redirect_uri")
+    if not redirect_uri:
+        raise HTTPException(400, "Invalid state: missing redirect_uri")
+
+    data = {
+        "code": code,
+        "client_id": p.client_id,
+        "client_secret": p.client_secret,
+        "redirect_uri": redirect_uri,
+        "grant_type": "authorization_code",
+    }
+    r, tok = await _post_token(p, data)
+    # GitHub reports errors with a 200 and an "error" field
+    if r.status_code != 200 or "error" in tok or not tok.get("access_token"):
+        raise HTTPException(400, f"Token exchange failed: {r.text}")
+
+    # Persist refresh + access token
+    entry = {
+        "access_token": tok.get("access_token"),
+        "refresh_token": tok.get("refresh_token"),  # may be None on subsequent grants
+        "scope": tok.get("scope"),
+        "token_type": tok.get("token_type"),
+        "expiry": _expiry(tok),
+    }
+    # Merge with existing to avoid dropping a good refresh_token
+    def merge(existing):
+        existing = existing or {}
+        if not entry.get("refresh_token") and existing.get("refresh_token"):
+            entry["refresh_token"] = existing["refresh_token"]
+        return entry
+
+    token_update(p.name, label, merge)
+    return {"status": "ok", "provider": p.name, "label": label, "has_refresh": bool(entry.get("refresh_token"))}
+
+def _is_fresh(entry: dict, lead: int = 0) -> bool:
+    if not entry.get("access_token"):
+        return False
+    expiry = entry.get("expiry")
+    return expiry is None or expiry - lead > _now()
+
+def _fresh_entry(p: Provider, label: str, lead: int = 0):
+    entry = token_get(p.name, label)
+    if not entry:
+        raise HTTPException(404, f"No {p.name} token for label '{label}'. Use /oauth to authenticate first.")
+    return entry, _is_fresh(entry, lead)
+
+NO_REFRESH_TOKEN = "No refresh_token stored. This usually happens when: 1) Initial OAuth didn't include 'offline' access, 2) Token was revoked, or 3) Refresh token expired. Please re-authenticate via /oauth"
+
+# How refresh_token grants report a dead refresh token (GitHub says bad_refresh_token)
+INVALID_GRANT_ERRORS = {"invalid_grant", "bad_refresh_token"}
+
+def _float_env(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, "") or default)
+    except ValueError:
+        return default
+
+# Shared by every provider
+BREAKER_THRESHOLD = int(_float_env("HS_OAUTH_BREAKER_THRESHOLD", 3))
+BREAKER_BASE_SECONDS = _float_env("HS_OAUTH_BREAKER_BASE_SECONDS", 30)
+BREAKER_MAX_SECONDS = _float_env("HS_OAUTH_BREAKER_MAX_SECONDS", 600)
+NEGATIVE_TTL_SECONDS = _float_env("HS_OAUTH_NEGATIVE_TTL_SECONDS", 5)
+
+# Cache lifetime for tokens that never expire, so revocations are still noticed
+NO_EXPIRY_MAX_AGE = 300
+
+class _Breaker:
+    """Per-label circuit breaker around upstream refreshes.
+
+    After BREAKER_THRESHOLD consecutive failures the circuit opens and callers
+    get the last error back immediately. Once open_until passes, the next
+    caller is let through as a probe (single-flight keeps it to one); a failed
+    probe reopens the circuit for twice as long, up to BREAKER_MAX_SECONDS.
+    """
+
+    def __init__(self, provider: str):
+        self.provider = provider
+        self.failures = 0
+        self.open_until = 0.0
+        self.backoff = BREAKER_BASE_SECONDS
+        self.last_error: HTTPException | None = None
+
+    def check(self, key: str) -> None:
+        remaining = self.open_until - time.time()
+        if remaining > 0 and self.last_error is not None:
+            refresh_outcomes.inc(provider=self.provider, outcome="circuit_open")
+            raise HTTPException(
+                503,
+                f"Token refresh for '{key}' is failing; next attempt in {int(remaining) + 1}s. Last error: {self.last_error.detail}",
+                headers={"Retry-After": str(int(remaining) + 1)},
+            )
+
+    def failed(self, key: str, error: HTTPException) -> None:
+        self.failures += 1
+        self.last_error = error
+        if self.failures >= BREAKER_THRESHOLD:
+            self.open_until = time.time() + self.backoff
+            logger.warning(f"Refresh circuit for '{key}' open for {self.backoff:.0f}s after {self.failures} failures")
+            self.backoff = min(self.backoff * 2, BREAKER_MAX_SECONDS)
+
+# Breakers, cached failures and in-flight refreshes are keyed "<provider>:<label>"
+_breakers: dict[str, _Breaker] = {}
+# key -> (expires_at, error) for the cheap "nothing to refresh" 404/409 cases.
+# Every entry has the same TTL, so insertion order is expiry order.
+_negative: OrderedDict[str, tuple[float, HTTPException]] = OrderedDict()
+NEGATIVE_MAX_ENTRIES = 1024
+
+def _remember_failure(key: str, error: HTTPException) -> None:
+    now = time.time()
+    _negative[key] = (now + NEGATIVE_TTL_SECONDS, error)
+    _negative.move_to_end(key)
+    # Unknown labels are unbounded input; drop expired entries, then the oldest
+    while _negative and next(iter(_negative.values()))[0] <= now:
+        _negative.popitem(last=False)
+    while len(_negative) > NEGATIVE_MAX_ENTRIES:
+        _negative.popitem(last=False)
+
+def _forget(provider: str, label: str, payload: dict) -> None:
+    # Any write (new tokens from a callback, a delete) invalidates cached failures
+    key = f"{provider}:{label}"
+    _negative.pop(key, None)
+    if payload.get("refresh_token"):
+        _breakers.pop(key, None)
+
+add_listener(_forget)
+
+async def _refresh_if_needed(p: Provider, label: str, lead: int = 0):
+    """Return p's entry for label, refreshing it if it expires within lead seconds."""
+    key = f"{p.name}:{label}"
+    cached_error = _negative.get(key)
+    if cached_error is not None:
+        if cached_error[0] > time.time():
+            raise cached_error[1]
+        _negative.pop(key, None)
+    try:
+        entry, fresh = _fresh_entry(p, label, lead)
+        if fresh:
+            return entry
+        if not entry.get("refresh_token"):
+            raise HTTPException(409, NO_REFRESH_TOKEN)
+    except HTTPException as e:
+        _remember_failure(key, e)
+        raise
+
+    breaker = _breakers.get(key)
+    if breaker is not None:
+        breaker.check(key)
+    # Coalesce concurrent refreshes for the same label into one upstream call
+    return dict(await _single_flight(key, lambda: _guarded_refresh(p, label, lead)))
+
+async def _guarded_refresh(p: Provider, label: str, lead: int):
+    key = f"{p.name}:{label}"
+    try:
+        entry = await _do_refresh(p, label, lead)
+    except HTTPException as e:
+        if e.status_code in (400, 502):
+            _breakers.setdefault(key, _Breaker(p.name)).failed(key, e)
+        raise
+    _breakers.pop(key, None)
+    return entry
+
+async def _do_refresh(p: Provider, label: str, lead: int = 0):
+    # Another flight may have finished between our check and becoming leader
+    entry, fresh = _fresh_entry(p, label, lead)
+    if fresh:
+        return entry
+
+    refresh = entry.get("refresh_token")
+    if not refresh:
+        raise HTTPException(409, NO_REFRESH_TOKEN)
+
+    data = {
+        "client_id": p.client_id,
+        "client_secret": p.client_secret,
+        "refresh_token": refresh,
+        "grant_type": "refresh_token",
+    }
+    if p.refresh_scope:
+        data["scope"] = " ".join(p.scopes)
+    try:
+        r, tok = await _post_token(p, data)
+    except httpx.HTTPError as e:
+        refresh_outcomes.inc(provider=p.name, outcome="network_error")
+        raise HTTPException(502, f"Refresh failed: {e!r}") from e
+    if r.status_code != 200 or "error" in tok:
+        if tok.get("error") in INVALID_GRANT_ERRORS:
+            refresh_outcomes.inc(provider=p.name, outcome="invalid_grant")
+            # Clear the bad token and provide helpful message
+            token_set(p.name, label, {})
+            raise HTTPException(400, "Refresh token has expired or been revoked. The token has been cleared. Please re-authenticate via /oauth to get a new token.")
+        refresh_outcomes.inc(provider=p.name, outcome="http_error")
+        raise HTTPException(400, f"Refresh failed: {r.text}")
+    refresh_outcomes.inc(provider=p.name, outcome="success")
+
+    def apply(current):
+        current = current or entry
+        current["access_token"] = tok.get("access_token")
+        current["expiry"] = _expiry(tok)
+        # Some providers re-issue refresh_token; Google usually doesn't on refresh
+        if tok.get("refresh_token"):
+            current["refresh_token"] = tok.get("refresh_token")
+        return current
+    return token_update(p.name, label, apply)
+
+@router.get("/oauth/{provider}/token")
+async def oauth_token(
+    provider: str,
+    request: Request,
+    response: Response,
+    x_api_key: str | None = Header(default=None),
+    label: str | None = None,
+):
+    p = get_provider(provider)
+    label = label or p.default_label
+    require_api_key(x_api_key, f"{p.name}:{label}")
+    entry = await _refresh_if_needed(p, label)
+    # Cacheable until the access token expires; the token itself is the version
+    expiry = entry.get("expiry")
+    max_age = NO_EXPIRY_MAX_AGE if expiry is None else max(0, expiry - _now())
+    etag = etag_for(entry["access_token"], expiry, entry.get("scope"))
+    not_modified = cached(request, response, etag, f"max-age={max_age}")
+    if not_modified is not None:
+        return not_modified
+    return _token_body(entry)
+
+def _token_body(entry: dict):
+    return {
+        "access_token": entry["access_token"],
+        "expiry": entry.get("expiry"),
+        "token_type": entry.get("token_type") or "Bearer",
+        "scope": entry.get("scope"),
+    }
+
+class TokensRequest(BaseModel):
+    labels: list[str]
+
+async def _token_or_error(p: Provider, label: str):
+    try:
+        return _token_body(await _refresh_if_needed(p, label))
+    except HTTPException as e:
+        return {"error": e.detail, "status_code": e.status_code}
+
+@router.post("/oauth/{provider}/tokens")
+async def oauth_tokens(provider: str, body: TokensRequest, x_api_key: str | None = Header(default=None)):
+    """Access tokens for several labels at once; expired ones are refreshed concurrently."""
+    p = get_provider(provider)
+    key = require_api_key(x_api_key, scope=None)
+    labels = list(dict.fromkeys(body.labels))
+    results = await asyncio.gather(*(
+        _token_or_error(p, label) if key.allows(f"{p.name}:{label}") else _forbidden()
+        for label in labels
+    ))
+    return {"tokens": dict(zip(labels, results))}
+
+async def _forbidden():
+    return {"error": "Forbidden", "status_code": 403}
+
+@router.get("/oauth/{provider}/events")
+async def oauth_events(
+    provider: str,
+    x_api_key: str | None = Header(default=None),
+    api_key: str | None = None,
+    label: str | None = None,
+):
+    """Server-Sent Events stream announcing token rotations for label (or every label)."""
+    p = get_provider(provider)
+    # EventSource can't set headers, so accept the key as a query parameter too
+    require_api_key(x_api_key or api_key, f"{p.name}:{label or '*'}")
+    return StreamingResponse(
+        token_events.subscribe(p.name, label),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.get("/oauth/{provider}/status")
+def oauth_status(provider: str, x_api_key: str | None = Header(default=None), label: str | None = None):
+    p = get_provider(provider)
+    label = label or p.default_label
+    require_api_key(x_api_key, f"{p.name}:{label}")
+    entry = token_get(p.name, label)
+
+    if not entry:
+        return {"status": "no_token", "message": "No token found. Please authenticate first."}
+
+    has_access = bool(entry.get("access_token"))
+    has_refresh = bool(entry.get("refresh_token"))
+    expiry = entry.get("expiry") if has_access else entry.get("expiry", 0)
+    is_expired = expiry is not None and expiry <= _now()
+
+    status = "ok"
+    message = "Token is valid and not expired"
+
+    if expiry is None:
+        message = "Token does not expire"
+    elif not has_refresh:
+        status = "no_refresh_token"
+        message = "Missing refresh token. Re-authentication required."
+    elif is_expired and not has_access:
+        status = "expired_no_access"
+        message = "Token expired and no access token available"
+    elif is_expired:
+        status = "expired"
+        message = "Access token expired but can be refreshed"
+
+    return {
+        "status": status,
+        "message": message,
+        "has_access_token": has_access,
+        "has_refresh_token": has_refresh,
+        "expires_at": expiry,
+        "expires_in_seconds": None if expiry is None else max(0, expiry - _now()),
+        "is_expired": is_expired,
+        "scope": entry.get("scope")
+    }
+
+@router.delete("/oauth/{provider}/token")
+def oauth_delete_token(provider: str, x_api_key: str | None = Header(default=None), label: str | None = None):
+    """Delete stored tokens for a label. Use this when tokens are corrupted or you want to start fresh."""
+    p = get_provider(provider)
+    target_label = label or p.default_label
+    require_api_key(x_api_key, f"{p.name}:{target_label}")
+
+    entry = token_get(p.name, target_label)
+    if not entry:
+        raise HTTPException(404, f"No {p.name} token found for label '{target_label}'")
+
+    token_set(p.name, target_label, {})
+    logger.info(f"Deleted {p.name} tokens for label: {target_label}")
+    return {"status": "ok", "message": f"Tokens deleted for label '{target_label}'. Use /oauth to re-authenticate."}
@@ -0,0 +1,85 @@
+import os
+from dataclasses import dataclass, field
+from fastapi import HTTPException
+
+@dataclass
+class Provider:
+    """One OAuth provider: its endpoints plus the client settings from <NAME>_* env vars."""
+
+    name: str
+    auth_url: str
+    token_url: str
+    client_id: str = ""
+    client_secret: str = ""
+    scopes: list[str] = field(default_factory=list)
+    default_label: str = "default"
+    # Extra query parameters for the authorize URL
+    auth_params: dict[str, str] = field(default_factory=dict)
+    # Send the configured scopes again with refresh_token grants
+    refresh_scope: bool = False
+
+    @property
+    def env_prefix(self) -> str:
+        return self.name.upper()
+
+# Adding a provider means adding an entry here; the engine in oauth_engine.py
+# and storage are shared. {tenant} is filled from <NAME>_TENANT.
+BUILTIN: dict[str, dict] = {
+    "google": {
+        "auth_url": "https://accounts.google.com/o/oauth2/v2/auth",
+        "token_url": "https://oauth2.googleapis.com/token",
+        "auth_params": {
+            "access_type": "offline",
+            "include_granted_scopes": "true",
+            "prompt": "consent",  # ensures refresh_token on first run
+        },
+    },
+    "microsoft": {
+        "auth_url": "https://login.microsoftonline.com/{tenant}/oauth2/v2.0/authorize",
+        "token_url": "https://login.microsoftonline.com/{tenant}/oauth2/v2.0/token",
+        "auth_params": {"response_mode": "query"},
+        "refresh_scope": True,
+    },
+    "github": {
+        "auth_url": "https://github.com/login/oauth/authorize",
+        "token_url": "https://github.com/login/oauth/access_token",
+    },
+}
+
+# Google was the only provider before the registry and stays on unless disabled
+_ENABLED_BY_DEFAULT = {"google"}
+
+def _from_env(name: str, spec: dict) -> Provider | None:
+    prefix = name.upper()
+    default = "true" if name in _ENABLED_BY_DEFAULT else "false"
+    if os.getenv(f"{prefix}_ENABLED", default).lower() != "true":
+        return None
+    tenant = os.getenv(f"{prefix}_TENANT", "") or "common"
+    return Provider(
+        name=name,
+        auth_url=spec["auth_url"].format(tenant=tenant),
+        token_url=spec["token_url"].format(tenant=tenant),
+        client_id=os.getenv(f"{prefix}_CLIENT_ID", ""),
+        client_secret=os.getenv(f"{prefix}_CLIENT_SECRET", ""),
+        scopes=(os.getenv(f"{prefix}_SCOPES", "") or "").split(),
+        default_label=os.getenv(f"{prefix}_TOKEN_LABEL", "") or "default",
+        auth_params=dict(spec.get("auth_params", {})),
+        refresh_scope=spec.get("refresh_scope", False),
+    )
+
+def load_providers() -> dict[str, Provider]:
+    """Read the configuration of every enabled provider (done once, at import)."""
+    loaded = {}
+    for name, spec in BUILTIN.items():
+        provider = _from_env(name, spec)
+        if provider is not None:
+            loaded[name] = provider
+    return loaded
+
+providers = load_providers()
+
+def get_provider(name: str) -> Provider:
+    provider = providers.get(name)
+    if provider is None:
+        raise HTTPException(404, f"OAuth provider '{name}' is unknown or disabled")
+    return provider
@@ -0,0 +1,143 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from fastapi import APIRouter, Header
+
+from storage import token_get, token_labels
+from oauth_engine import _refresh_if_needed
+from oauth_providers import Provider, get_provider, providers
+from auth import require_api_key
+from metrics import Counter, refresh_lead
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+proactive_failures = Counter("hs_proactive_refresh_failures_total", "Failed background refresh attempts by provider and label")
+
+def _int_env(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, "") or default)
+    except ValueError:
+        return default
+
+class Refresher:
+    """Refreshes every stored label of every enabled provider shortly before it expires.
+
+    Runs as a task on the app's event loop and shares the single-flight
+    path with /oauth/{provider}/token, so a request racing the refresher never
+    triggers a second upstream call.
+    """
+
+    def __init__(self, lead: int, jitter: int, interval: int, max_backoff: int):
+        self.lead = lead
+        self.jitter = jitter
+        self.interval = interval
+        self.max_backoff = max_backoff
+        self._labels: dict[tuple[str, str], dict] = {}
+        self.stats = {
+            "refreshes": 0,
+            "failures": 0,
+            "last_lead_seconds": None,
+            "min_lead_seconds": None,
+            "lead_seconds_sum": 0,
+        }
+
+    @classmethod
+    def from_env(cls) -> "Refresher":
+        return cls(
+            lead=_int_env("HS_OAUTH_REFRESH_LEAD_SECONDS", 300),
+            jitter=_int_env("HS_OAUTH_REFRESH_JITTER_SECONDS", 30),
+            interval=_int_env("HS_OAUTH_REFRESH_INTERVAL_SECONDS", 15),
+            max_backoff=_int_env("HS_OAUTH_REFRESH_MAX_BACKOFF_SECONDS", 900),
+        )
+
+    def _state(self, provider: str, label: str) -> dict:
+        st = self._labels.get((provider, label))
+        if st is None:
+            st = self._labels[provider, label] = {
+                "jitter": random.uniform(0, self.jitter),
+                "retry_at": 0.0,
+                "failures": 0,
+                "last_error": None,
+            }
+        return st
+
+    async def run(self, stop: asyncio.Event) -> None:
+        logger.info(f"Token refresher started (lead={self.lead}s, jitter={self.jitter}s)")
+        while not stop.is_set():
+            try:
+                await self.tick()
+            except Exception:
+                logger.exception("Token refresher tick failed")
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def tick(self) -> None:
+        now = time.time()
+        for p in list(providers.values()):
+            for label in token_labels(p.name):
+                entry = token_get(p.name, label)
+                if not entry or not entry.get("refresh_token"):
+                    continue
+                expiry = entry.get("expiry", 0)
+                # Tokens without an expiry (GitHub OAuth apps) never need refreshing
+                if expiry is None:
+                    continue
+                st = self._state(p.name, label)
+                due = expiry - self.lead - st["jitter"]
+                if max(due, st["retry_at"]) <= now:
+                    await self._refresh(p, label, entry, st)
+
+    async def _refresh(self, p: Provider, label: str, entry: dict, st: dict) -> None:
+        expiry = entry.get("expiry") or 0
+        # An expiry of 0 marks a token that was forced stale, not a real deadline
+        lead = max(int(expiry - time.time()), 0) if expiry > 0 else None
+        try:
+            # Refresh anything expiring within lead+jitter so it agrees with the due check above
+            await _refresh_if_needed(p, label, self.lead + int(st["jitter"]) + 1)
+        except Exception as e:
+            st["failures"] += 1
+            st["last_error"] = getattr(e, "detail", None) or str(e)
+            backoff = min(self.max_backoff, self.interval * 2 ** (st["failures"] - 1))
+            st["retry_at"] = time.time() + backoff * random.uniform(0.5, 1.0)
+            self.stats["failures"] += 1
+            proactive_failures.inc(provider=p.name, label=label)
+            logger.warning(f"Proactive refresh failed for {p.name} '{label}' (attempt {st['failures']}, retry in ~{backoff}s): {st['last_error']}")
+            return
+
+        st.update(failures=0, retry_at=0.0, last_error=None, jitter=random.uniform(0, self.jitter))
+        self.stats["refreshes"] += 1
+        if lead is None:
+            return
+        self.stats["last_lead_seconds"] = lead
+        refresh_lead.observe(lead)
+        self.stats["lead_seconds_sum"] += lead
+        if self.stats["min_lead_seconds"] is None or lead < self.stats["min_lead_seconds"]:
+            self.stats["min_lead_seconds"] = lead
+
+    def snapshot(self, provider: str) -> dict:
+        """Overall stats plus the per-label state of one provider's labels."""
+        return {
+            "lead_seconds": self.lead,
+            **self.stats,
+            "labels": {
+                label: {k: v for k, v in st.items() if k != "jitter"}
+                for (name, label), st in self._labels.items()
+                if name == provider
+            },
+        }
+
+refresher: Refresher | None = None
+
+@router.get("/oauth/{provider}/refresher")
+def refresher_status(provider: str, x_api_key: str | None = Header(default=None)):
+    p = get_provider(provider)
+    require_api_key(x_api_key, f"{p.name}:*")
+    if refresher is None:
+        return {"status": "disabled"}
+    return {"status": "running", **refresher.snapshot(p.name)}
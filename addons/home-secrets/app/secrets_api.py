@@ -1,20 +1,126 @@
+import json
+import logging
 import os
-from fastapi import APIRouter, Header, HTTPException
+from pathlib import Path
+from fastapi import APIRouter, Header, HTTPException, Request, Response
+from pydantic import BaseModel
+
+from auth import require_api_key
+from http_cache import cached, etag_for
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-def require_api_key(x_api_key: str | None):
-    expected = os.getenv("HS_API_KEY") or ""
-    if not expected or x_api_key != expected:
-        raise HTTPException(status_code=403, detail="Forbidden")
+# Add-on options as saved by the Supervisor. The run script exports extra_env
+# only when the process starts, so reloads read changes from here.
+OPTIONS_FILE = Path(os.getenv("HS_OPTIONS_FILE", "/data/options.json"))
+
+# Prefix-filtered snapshot of the environment, built once at startup.
+# Call reload_secrets() (or POST /secrets/reload) after the options change.
+_prefix = "HS_"
+_index: dict[str, str] = {}
+# extra_env as last applied to os.environ, so removed entries can be dropped
+_applied: dict[str, str] = {}
+
+# The server's own settings share the HS_ namespace; exactly the names it
+# reads are never served as secrets. The storage passphrase lives outside it
+# but is listed in case the prefix is changed to cover it.
+_RESERVED = {
+    "HS_API_KEY", "HS_API_KEYS", "HS_API_RATE_LIMIT", "HS_API_RATE_BURST",
+    "HS_DATA_DIR", "HS_STORAGE_BACKEND", "HS_METRICS_ENABLED", "HS_CORS_ALLOWED_ORIGINS",
+    "HS_SECRET_PREFIX", "HS_OPTIONS_FILE",
+    "HS_OAUTH_STATE_TTL_SECONDS", "HS_OAUTH_STATE_MAX", "HS_OAUTH_STATE_PERSIST",
+    "HS_OAUTH_BREAKER_THRESHOLD", "HS_OAUTH_BREAKER_BASE_SECONDS", "HS_OAUTH_BREAKER_MAX_SECONDS",
+    "HS_OAUTH_NEGATIVE_TTL_SECONDS",
+    "HS_OAUTH_REFRESH_LEAD_SECONDS", "HS_OAUTH_REFRESH_JITTER_SECONDS",
+    "HS_OAUTH_REFRESH_INTERVAL_SECONDS", "HS_OAUTH_REFRESH_MAX_BACKOFF_SECONDS",
+    "HOME_SECRETS_ENCRYPTION_KEY",
+}
+
+def _reserved(name: str) -> bool:
+    return name.upper() in _RESERVED
+
+def _read_options() -> dict:
+    try:
+        options = json.loads(OPTIONS_FILE.read_text())
+    except FileNotFoundError:
+        return {}
+    except ValueError as e:
+        logger.warning(f"Ignoring unreadable {OPTIONS_FILE}: {e}")
+        return {}
+    return options if isinstance(options, dict) else {}
+
+def _apply_options(options: dict) -> None:
+    global _applied
+    extra = options.get("extra_env")
+    if not isinstance(extra, dict):
+        return
+    current = {str(k): "" if v is None else str(v) for k, v in extra.items()}
+    for key in _applied.keys() - current.keys():
+        os.environ.pop(key, None)
+    os.environ.update(current)
+    _applied = current
+
+def reload_secrets() -> int:
+    """Rebuild the index from the environment plus the current add-on options."""
+    global _prefix, _index
+    options = _read_options()
+    _apply_options(options)
+    prefix = options.get("secret_prefix") or os.getenv("HS_SECRET_PREFIX", "HS_")
+    upper = prefix.upper()
+    _index = {k: v for k, v in os.environ.items() if k.startswith(upper) and not _reserved(k)}
+    for key in sorted(_applied):
+        if key.upper().startswith(upper) and _reserved(key):
+            logger.warning(f"extra_env entry {key} is not served: the add-on uses that name for its own settings")
+    _prefix = prefix
+    return len(_index)
+
+reload_secrets()
+
+def _lookup(key: str) -> tuple[str, str | None]:
+    env_var = f"{_prefix}{key}".upper()
+    return env_var, _index.get(env_var)
 
 @router.get("/secret/{key}")
-def get_secret(key: str, x_api_key: str | None = Header(default=None)):
-    require_api_key(x_api_key)
+def get_secret(request: Request, response: Response, key: str, x_api_key: str | None = Header(default=None)):
+    require_api_key(x_api_key, "secrets")
 
-    prefix = os.getenv("HS_SECRET_PREFIX", "HS_")
-    env_var = f"{prefix}{key}".upper()
-    val = os.getenv(env_var)
+    env_var, val = _lookup(key)
     if val is None:
         raise HTTPException(status_code=404, detail=f"{env_var} not set")
-    return {"key": key, "env": env_var, "value": val}
\ No newline at end of file
+    # Secrets can change on reload, so clients must revalidate (cheap 304) before reuse
+    not_modified = cached(request, response, etag_for(key, env_var, val), "no-cache")
+    if not_modified is not None:
+        return not_modified
+    return {"key": key, "env": env_var, "value": val}
+
+def _bulk(keys: list[str]):
+    found = {}
+    missing = []
+    for key in dict.fromkeys(keys):
+        env_var, val = _lookup(key)
+        if val is None:
+            missing.append(key)
+        else:
+            found[key] = {"env": env_var, "value": val}
+    return {"secrets": found, "missing": missing}
+
+class SecretsRequest(BaseModel):
+    keys: list[str]
+
+@router.get("/secrets")
+def get_secrets(keys: str, x_api_key: str | None = Header(default=None)):
+    """Several secrets in one call: /secrets?keys=A,B,C"""
+    require_api_key(x_api_key, "secrets")
+    return _bulk([k.strip() for k in keys.split(",") if k.strip()])
+
+@router.post("/secrets")
+def post_secrets(body: SecretsRequest, x_api_key: str | None = Header(default=None)):
+    require_api_key(x_api_key, "secrets")
+    return _bulk(body.keys)
+
+@router.post("/secrets/reload")
+def post_secrets_reload(x_api_key: str | None = Header(default=None)):
+    require_api_key(x_api_key, "secrets")
+    return {"status": "ok", "count": reload_secrets()}
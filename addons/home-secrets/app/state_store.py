@@ -0,0 +1,75 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any
+
+from storage import BASE, _read_json, _write_json
+
+class StateStore:
+    """Short-lived OAuth "state" values for in-flight authorization flows.
+
+    Kept apart from token storage so abandoned flows can't grow the token
+    file. Entries expire after ttl seconds and the oldest are evicted once
+    max_size is reached; lookups and removals are O(1). When persist_path is
+    set the map is also written there so a restart mid-flow doesn't lose it.
+    """
+
+    def __init__(self, ttl: int = 600, max_size: int = 1000, persist_path: Path | None = None):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.persist_path = persist_path
+        self._lock = threading.Lock()
+        self._items: OrderedDict[str, dict[str, Any]] = OrderedDict()
+        if persist_path is not None:
+            for state, ctx in _read_json(persist_path).items():
+                self._items[state] = ctx
+            self._purge(time.time())
+
+    @classmethod
+    def from_env(cls) -> "StateStore":
+        persist = os.getenv("HS_OAUTH_STATE_PERSIST", "false").lower() == "true"
+        return cls(
+            ttl=int(os.getenv("HS_OAUTH_STATE_TTL_SECONDS", "600")),
+            max_size=int(os.getenv("HS_OAUTH_STATE_MAX", "1000")),
+            persist_path=BASE / "oauth_state.json" if persist else None,
+        )
+
+    def _purge(self, now: float) -> None:
+        # Insertion order is creation order, so expired entries sit at the front
+        while self._items:
+            state, ctx = next(iter(self._items.items()))
+            if ctx.get("ts", 0) + self.ttl > now:
+                break
+            del self._items[state]
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def _persist(self) -> None:
+        if self.persist_path is not None:
+            _write_json(self.persist_path, dict(self._items))
+
+    def put(self, state: str, ctx: dict[str, Any]) -> None:
+        with self._lock:
+            ctx = {**ctx, "ts": ctx.get("ts", time.time())}
+            self._items[state] = ctx
+            self._items.move_to_end(state)
+            self._purge(time.time())
+            self._persist()
+
+    def pop(self, state: str) -> dict[str, Any] | None:
+        """Remove and return the context for state, or None if unknown or expired."""
+        with self._lock:
+            ctx = self._items.pop(state, None)
+            if ctx is None:
+                return None
+            self._persist()
+            if ctx.get("ts", 0) + self.ttl <= time.time():
+                return None
+            return ctx
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+states = StateStore.from_env()
@@ -1,30 +1,551 @@
+import base64
+import hashlib
 import json
+import logging
 import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
 from pathlib import Path
-from typing import Any
+from typing import Any, Callable
 
-BASE = Path("/data/hs")
-BASE.mkdir(parents=True, exist_ok=True)
+from metrics import storage_latency
+
+BASE = Path(os.getenv("HS_DATA_DIR", "/data/hs"))
 GOOGLE_FILE = BASE / "google_tokens.json"
+TOKEN_DB = BASE / "tokens.db"
+SALT_FILE = BASE / "storage.salt"
+
+logger = logging.getLogger(__name__)
+
+Updater = Callable[[dict[str, Any] | None], dict[str, Any]]
 
 def _read_json(path: Path) -> dict[str, Any]:
     if not path.exists():
         return {}
-    try:
-        return json.loads(path.read_text())
-    except Exception:
-        return {}
+    with storage_latency.time(op="read_json"):
+        try:
+            return json.loads(path.read_text())
+        except Exception:
+            return {}
 
 def _write_json(path: Path, data: dict[str, Any]) -> None:
-    tmp = path.with_suffix(".tmp")
-    tmp.write_text(json.dumps(data, indent=2))
-    tmp.replace(path)
-
-def google_get(label: str) -> dict[str, Any] | None:
-    data = _read_json(GOOGLE_FILE)
-    return data.get(label)
-
-def google_set(label: str, payload: dict[str, Any]) -> None:
-    data = _read_json(GOOGLE_FILE)
-    data[label] = payload
-    _write_json(GOOGLE_FILE, data)
\ No newline at end of file
+    with storage_latency.time(op="write_json"):
+        # Created on first write rather than at import to keep startup free of side effects
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(data, indent=2))
+        tmp.replace(path)
+
+def _stat_key(path: Path) -> tuple[int, int, int] | None:
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+class TokenBackend:
+    """Interface behind token_get/token_set; one entry (a JSON object) per label."""
+
+    def get(self, label: str) -> dict[str, Any] | None:
+        raise NotImplementedError
+
+    def set(self, label: str, payload: dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def update(self, label: str, fn: Updater) -> dict[str, Any]:
+        """Atomically read-modify-write one label; fn gets a copy of the current entry."""
+        raise NotImplementedError
+
+    def delete(self, label: str) -> bool:
+        raise NotImplementedError
+
+    def labels(self) -> list[str]:
+        raise NotImplementedError
+
+class JsonBackend(TokenBackend):
+    """Process-resident copy of a JSON token file.
+
+    Reads are served from memory; a cheap stat() per call notices edits made
+    outside this process (inode/mtime/size change) and triggers a reload.
+    Writes go through to disk atomically before the cache is updated.
+    Locking is in-process only, so use a single uvicorn worker with it.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.lock = threading.RLock()
+        self._data: dict[str, Any] | None = None
+        self._stat: tuple[int, int, int] | None = None
+
+    def _fresh(self) -> dict[str, Any]:
+        st = _stat_key(self.path)
+        if self._data is None or st != self._stat:
+            self._data = _read_json(self.path)
+            self._stat = st
+        return self._data
+
+    def get(self, label: str) -> dict[str, Any] | None:
+        with self.lock:
+            entry = self._fresh().get(label)
+            # Hand out a copy so callers can't mutate the cached entry
+            return dict(entry) if isinstance(entry, dict) else entry
+
+    def set(self, label: str, payload: dict[str, Any]) -> None:
+        with self.lock:
+            data = dict(self._fresh())
+            data[label] = payload
+            _write_json(self.path, data)
+            self._data = data
+            self._stat = _stat_key(self.path)
+
+    def labels(self) -> list[str]:
+        with self.lock:
+            return list(self._fresh())
+
+    def update(self, label: str, fn: Updater) -> dict[str, Any]:
+        with self.lock:
+            payload = fn(self.get(label))
+            self.set(label, payload)
+            return dict(payload)
+
+    def delete(self, label: str) -> bool:
+        with self.lock:
+            data = dict(self._fresh())
+            if data.pop(label, None) is None:
+                return False
+            _write_json(self.path, data)
+            self._data = data
+            self._stat = _stat_key(self.path)
+            return True
+
+    def invalidate(self) -> None:
+        with self.lock:
+            self._data = None
+            self._stat = None
+
+class SqliteBackend(TokenBackend):
+    """One row per label in a table of a WAL-mode SQLite database.
+
+    Every call reads committed state, so writes from other worker processes
+    are visible immediately; update() runs inside BEGIN IMMEDIATE so
+    concurrent read-modify-writes across processes serialize instead of
+    losing updates. Connections are per thread.
+    """
+
+    def __init__(self, path: Path, migrate_from: Path | None = None, table: str = "tokens"):
+        if not table.isidentifier():
+            raise ValueError(f"Invalid table name '{table}'")
+        self.path = path
+        self.table = table
+        self._local = threading.local()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        conn = self._conn()
+        conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            " label TEXT PRIMARY KEY, payload TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        if migrate_from is not None:
+            self._migrate(migrate_from)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _migrate(self, legacy: Path) -> None:
+        """One-time import of a JSON token file; the file is kept as *.migrated."""
+        if not legacy.exists():
+            return
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute(f"SELECT 1 FROM {self.table} LIMIT 1").fetchone() is None:
+                now = time.time()
+                rows = [
+                    (label, json.dumps(payload), now)
+                    for label, payload in _read_json(legacy).items()
+                    if not label.startswith("__") and isinstance(payload, dict)
+                ]
+                conn.executemany(f"INSERT INTO {self.table} VALUES (?, ?, ?)", rows)
+                logger.info(f"Migrated {len(rows)} token label(s) from {legacy.name} to {self.path.name}")
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        try:
+            legacy.replace(legacy.with_name(legacy.name + ".migrated"))
+        except FileNotFoundError:
+            pass  # another worker got there first
+
+    def _select(self, conn: sqlite3.Connection, label: str) -> dict[str, Any] | None:
+        row = conn.execute(f"SELECT payload FROM {self.table} WHERE label = ?", (label,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _upsert(self, conn: sqlite3.Connection, label: str, payload: dict[str, Any]) -> None:
+        conn.execute(
+            f"INSERT INTO {self.table} VALUES (?, ?, ?) ON CONFLICT(label) DO UPDATE"
+            " SET payload = excluded.payload, updated_at = excluded.updated_at",
+            (label, json.dumps(payload), time.time()),
+        )
+
+    def get(self, label: str) -> dict[str, Any] | None:
+        with storage_latency.time(op="sqlite_get"):
+            return self._select(self._conn(), label)
+
+    def set(self, label: str, payload: dict[str, Any]) -> None:
+        with storage_latency.time(op="sqlite_set"):
+            self._upsert(self._conn(), label, payload)
+
+    def update(self, label: str, fn: Updater) -> dict[str, Any]:
+        conn = self._conn()
+        with storage_latency.time(op="sqlite_update"):
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                payload = fn(self._select(conn, label))
+                self._upsert(conn, label, payload)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return dict(payload)
+
+    def delete(self, label: str) -> bool:
+        return self._conn().execute(f"DELETE FROM {self.table} WHERE label = ?", (label,)).rowcount > 0
+
+    def labels(self) -> list[str]:
+        return [row[0] for row in self._conn().execute(f"SELECT label FROM {self.table}")]
+
+class JournalBackend(TokenBackend):
+    """Append-only log of per-label writes, replayed into memory at startup.
+
+    Each write appends one compact JSON line ({"l": label, "p": payload}, or
+    {"l": label, "d": 1} for a delete) instead of rewriting the whole file.
+    Lines are flushed to the OS at once; fsync is batched so at most one
+    happens per sync_interval seconds, which bounds what a power cut can
+    lose without paying a flash write per token. A torn last line left by a
+    crash is cut off on replay. Once the log passes compact_bytes (and is
+    mostly superseded records) it is rewritten to one line per live label
+    on a background thread. Like JsonBackend, use a single uvicorn worker.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        migrate_from: Path | None = None,
+        sync_interval: float = 1.0,
+        compact_bytes: int = 256 * 1024,
+    ):
+        self.path = path
+        self.sync_interval = sync_interval
+        self.compact_bytes = compact_bytes
+        self.lock = threading.RLock()
+        self._data: dict[str, Any] = {}
+        self._last_sync = 0.0
+        self._sync_timer: threading.Timer | None = None
+        self._compacting = False
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if path.exists():
+            self._replay()
+        elif migrate_from is not None and migrate_from.exists():
+            self._data = {
+                label: payload for label, payload in _read_json(migrate_from).items()
+                if not label.startswith("__") and isinstance(payload, dict)
+            }
+            self._rewrite()
+            migrate_from.replace(migrate_from.with_name(migrate_from.name + ".migrated"))
+            logger.info(f"Migrated {len(self._data)} token label(s) from {migrate_from.name} to {path.name}")
+        self._file = open(path, "ab")
+        self._size = self._file.tell()
+
+    @staticmethod
+    def _record(label: str, payload: dict[str, Any] | None) -> bytes:
+        record = {"l": label, "d": 1} if payload is None else {"l": label, "p": payload}
+        return json.dumps(record, separators=(",", ":")).encode() + b"\n"
+
+    def _replay(self) -> None:
+        with storage_latency.time(op="journal_replay"):
+            raw = self.path.read_bytes()
+            good = 0  # end offset of the last complete record
+            for lineno, line in enumerate(raw.split(b"\n"), 1):
+                end = good + len(line) + 1
+                if end > len(raw):
+                    break  # last line has no newline: write cut short by a crash
+                try:
+                    record = json.loads(line)
+                    label = record["l"]
+                    if record.get("d"):
+                        self._data.pop(label, None)
+                    else:
+                        self._data[label] = record["p"]
+                except (ValueError, KeyError, TypeError):
+                    logger.warning(f"Skipping unreadable record on line {lineno} of {self.path.name}")
+                good = end
+        if good < len(raw):
+            logger.warning(f"Dropping {len(raw) - good} byte(s) of incomplete record at the end of {self.path.name}")
+            with open(self.path, "r+b") as f:
+                f.truncate(good)
+                os.fsync(f.fileno())
+
+    def _rewrite(self) -> None:
+        """Replace the log with one record per live label (fsynced before the rename)."""
+        tmp = self.path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp, "wb") as f:
+            f.writelines(self._record(label, payload) for label, payload in self._data.items())
+            f.flush()
+            os.fsync(f.fileno())
+        tmp.replace(self.path)
+
+    def _append(self, label: str, payload: dict[str, Any] | None) -> None:
+        line = self._record(label, payload)
+        with storage_latency.time(op="journal_append"):
+            self._file.write(line)
+            self._file.flush()
+        self._size += len(line)
+        self._schedule_sync()
+        if self._size > self.compact_bytes and not self._compacting:
+            live = sum(len(self._record(k, v)) for k, v in self._data.items())
+            # Skip compaction if it would barely shrink the log (a large live set)
+            if live * 2 < self._size:
+                self._compacting = True
+                threading.Thread(target=self._compact, name="journal-compact", daemon=True).start()
+
+    def _schedule_sync(self) -> None:
+        wait = self._last_sync + self.sync_interval - time.monotonic()
+        if wait <= 0:
+            self._sync()
+        elif self._sync_timer is None:
+            self._sync_timer = threading.Timer(wait, self._sync)
+            self._sync_timer.daemon = True
+            self._sync_timer.start()
+
+    def _sync(self) -> None:
+        with self.lock:
+            self._sync_timer = None
+            self._last_sync = time.monotonic()
+            if not self._file.closed:
+                os.fsync(self._file.fileno())
+
+    def _compact(self) -> None:
+        # Holds the lock throughout; the live set is small, so writers only wait milliseconds
+        try:
+            with self.lock, storage_latency.time(op="journal_compact"):
+                before = self._size
+                self._rewrite()
+                self._file.close()
+                self._file = open(self.path, "ab")
+                self._size = self._file.tell()
+                logger.info(f"Compacted {self.path.name} from {before} to {self._size} bytes")
+        except Exception:
+            logger.exception(f"Compacting {self.path.name} failed")
+            with self.lock:
+                if self._file.closed:
+                    self._file = open(self.path, "ab")
+        finally:
+            self._compacting = False
+
+    def get(self, label: str) -> dict[str, Any] | None:
+        with self.lock:
+            entry = self._data.get(label)
+            return dict(entry) if isinstance(entry, dict) else entry
+
+    def set(self, label: str, payload: dict[str, Any]) -> None:
+        with self.lock:
+            self._append(label, payload)
+            self._data[label] = dict(payload)
+
+    def update(self, label: str, fn: Updater) -> dict[str, Any]:
+        with self.lock:
+            payload = fn(self.get(label))
+            self.set(label, payload)
+            return dict(payload)
+
+    def delete(self, label: str) -> bool:
+        with self.lock:
+            if label not in self._data:
+                return False
+            self._append(label, None)
+            del self._data[label]
+            return True
+
+    def labels(self) -> list[str]:
+        with self.lock:
+            return list(self._data)
+
+def derive_key(passphrase: str, salt_file: Path) -> bytes:
+    """scrypt a 256-bit key from the passphrase; the random salt is created once and kept."""
+    if salt_file.exists():
+        salt = salt_file.read_bytes()
+    else:
+        salt_file.parent.mkdir(parents=True, exist_ok=True)
+        salt = os.urandom(16)
+        salt_file.write_bytes(salt)
+    return hashlib.scrypt(passphrase.encode(), salt=salt, n=2**14, r=8, p=1, dklen=32)
+
+class EncryptedBackend(TokenBackend):
+    """Stores each entry of an inner backend as {"enc": base64(nonce + AES-GCM ciphertext)}.
+
+    The key is derived once by the caller. Decrypted entries are kept in a
+    bounded LRU keyed by label and ciphertext, so reads of unchanged entries skip the
+    cipher entirely and only writes encrypt. The label is bound in as
+    associated data so entries can't be swapped between labels. Plaintext
+    entries found at startup are encrypted in place.
+    """
+
+    def __init__(self, inner: TokenBackend, key: bytes, cache_size: int = 256):
+        try:
+            from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+        except ImportError as e:
+            raise RuntimeError("Encrypted token storage needs the 'cryptography' package") from e
+        self.inner = inner
+        self._aead = AESGCM(key)
+        self._cache: OrderedDict[tuple[str, str], dict[str, Any]] = OrderedDict()
+        self._cache_size = cache_size
+        self._lock = threading.Lock()
+        for label in inner.labels():
+            stored = inner.get(label)
+            if isinstance(stored, dict) and "enc" not in stored:
+                inner.set(label, self._seal(label, stored))
+            else:
+                self._open(label, stored)  # fails fast on a wrong key
+
+    def _remember(self, label: str, sealed: str, payload: dict[str, Any]) -> None:
+        with self._lock:
+            self._cache[label, sealed] = payload
+            self._cache.move_to_end((label, sealed))
+            while len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+
+    def _seal(self, label: str, payload: dict[str, Any]) -> dict[str, Any]:
+        nonce = os.urandom(12)
+        ct = self._aead.encrypt(nonce, json.dumps(payload).encode(), label.encode())
+        sealed = base64.b64encode(nonce + ct).decode()
+        self._remember(label, sealed, dict(payload))
+        return {"enc": sealed}
+
+    def _open(self, label: str, stored: dict[str, Any] | None) -> dict[str, Any] | None:
+        if not isinstance(stored, dict) or "enc" not in stored:
+            return stored
+        sealed = stored["enc"]
+        with self._lock:
+            # Keyed by label too: a cache hit must not skip the associated data check
+            payload = self._cache.get((label, sealed))
+            if payload is not None:
+                self._cache.move_to_end((label, sealed))
+                return dict(payload)
+        raw = base64.b64decode(sealed)
+        try:
+            payload = json.loads(self._aead.decrypt(raw[:12], raw[12:], label.encode()))
+        except Exception as e:
+            raise RuntimeError(f"Cannot decrypt stored token for '{label}'; wrong storage_encryption_key?") from e
+        self._remember(label, sealed, payload)
+        return dict(payload)
+
+    def get(self, label: str) -> dict[str, Any] | None:
+        return self._open(label, self.inner.get(label))
+
+    def set(self, label: str, payload: dict[str, Any]) -> None:
+        self.inner.set(label, self._seal(label, payload))
+
+    def update(self, label: str, fn: Updater) -> dict[str, Any]:
+        result = {}
+
+        def apply(stored):
+            result["payload"] = fn(self._open(label, stored))
+            return self._seal(label, result["payload"])
+
+        self.inner.update(label, apply)
+        return dict(result["payload"])
+
+    def delete(self, label: str) -> bool:
+        return self.inner.delete(label)
+
+    def labels(self) -> list[str]:
+        return self.inner.labels()
+
+def _token_file(provider: str) -> Path:
+    # Google keeps the file name it had before there were other providers
+    return GOOGLE_FILE if provider == "google" else BASE / f"{provider}_tokens.json"
+
+_key: bytes | None = None
+
+def _encryption_key(passphrase: str) -> bytes:
+    # Derived once per process and shared by every provider's backend
+    global _key
+    if _key is None:
+        _key = derive_key(passphrase, SALT_FILE)
+    return _key
+
+def _make_backend(provider: str) -> TokenBackend:
+    kind = os.getenv("HS_STORAGE_BACKEND", "json").lower()
+    json_file = _token_file(provider)
+    if kind == "sqlite":
+        table = "tokens" if provider == "google" else f"tokens_{provider}"
+        backend: TokenBackend = SqliteBackend(TOKEN_DB, migrate_from=json_file, table=table)
+    elif kind == "journal":
+        backend = JournalBackend(json_file.with_suffix(".journal"), migrate_from=json_file)
+    else:
+        if kind != "json":
+            logger.warning(f"Unknown HS_STORAGE_BACKEND '{kind}', using json")
+        backend = JsonBackend(json_file)
+    passphrase = os.getenv("HOME_SECRETS_ENCRYPTION_KEY") or ""
+    if passphrase:
+        backend = EncryptedBackend(backend, _encryption_key(passphrase))
+    else:
+        for label in backend.labels():
+            stored = backend.get(label)
+            # Served as-is, sealed entries would look like tokens without a refresh token
+            if isinstance(stored, dict) and "enc" in stored:
+                raise RuntimeError(f"Stored {provider} tokens are encrypted but no storage_encryption_key is set")
+    return backend
+
+_backends: dict[str, TokenBackend] = {}
+_backends_lock = threading.Lock()
+
+def _backend(provider: str) -> TokenBackend:
+    backend = _backends.get(provider)
+    if backend is None:
+        with _backends_lock:
+            backend = _backends.get(provider)
+            if backend is None:
+                backend = _backends[provider] = _make_backend(provider)
+    return backend
+
+# Called as fn(provider, label, payload) after every token write; must not block.
+_listeners: list[Callable[[str, str, dict[str, Any]], None]] = []
+
+def add_listener(fn: Callable[[str, str, dict[str, Any]], None]) -> None:
+    _listeners.append(fn)
+
+def _notify(provider: str, label: str, payload: dict[str, Any]) -> None:
+    if label.startswith("__"):
+        return
+    for fn in _listeners:
+        fn(provider, label, payload)
+
+def token_get(provider: str, label: str) -> dict[str, Any] | None:
+    return _backend(provider).get(label)
+
+def token_set(provider: str, label: str, payload: dict[str, Any]) -> None:
+    _backend(provider).set(label, payload)
+    _notify(provider, label, payload)
+
+def token_labels(provider: str) -> list[str]:
+    """Stored token labels, excluding internal "__...__" bookkeeping entries."""
+    return [label for label in _backend(provider).labels() if not label.startswith("__")]
+
+def token_update(provider: str, label: str, fn: Updater) -> dict[str, Any]:
+    payload = _backend(provider).update(label, fn)
+    _notify(provider, label, payload)
+    return payload
+
+def token_delete(provider: str, label: str) -> bool:
+    deleted = _backend(provider).delete(label)
+    if deleted:
+        _notify(provider, label, {})
+    return deleted
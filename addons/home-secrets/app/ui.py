@@ -0,0 +1,89 @@
+import gzip
+import hashlib
+from pathlib import Path
+from fastapi import APIRouter, Request, Response
+from fastapi.staticfiles import StaticFiles
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+STATIC_DIR = Path(__file__).parent / "static"
+
+router = APIRouter()
+
+def _compress(raw: bytes, encoding: str, build: bool) -> bytes:
+    if encoding == "gzip":
+        return gzip.compress(raw, 9, mtime=0)
+    # Maximum brotli quality is slow on ARM boards; only pay for it at build time
+    return brotli.compress(raw, quality=11 if build else 5)
+
+_SUFFIXES = {"gzip": ".gz", "br": ".br"}
+
+def precompress(directory: Path = STATIC_DIR) -> None:
+    """Write .gz/.br siblings for every static file (run during the image build)."""
+    for path in directory.iterdir():
+        if path.suffix in (".gz", ".br") or not path.is_file():
+            continue
+        raw = path.read_bytes()
+        for encoding, suffix in _SUFFIXES.items():
+            if encoding == "br" and brotli is None:
+                continue
+            path.with_name(path.name + suffix).write_bytes(_compress(raw, encoding, build=True))
+
+class StaticAsset:
+    """A file read once, with compressed variants, served from memory.
+
+    Uses .gz/.br files written by precompress() when they are up to date and
+    compresses on load otherwise. Picks the best encoding the client accepts
+    (br > gzip > identity) and answers If-None-Match with 304. Each encoding
+    is its own representation, so each gets its own strong ETag.
+    """
+
+    def __init__(self, path: Path, media_type: str, max_age: int = 300):
+        raw = path.read_bytes()
+        self.media_type = media_type
+        digest = hashlib.sha256(raw).hexdigest()[:20]
+        self.etags = {"identity": f'"{digest}"', "gzip": f'"{digest}-gz"', "br": f'"{digest}-br"'}
+        self.cache_control = f"public, max-age={max_age}"
+        self.bodies = {"identity": raw}
+        mtime = path.stat().st_mtime
+        for encoding, suffix in _SUFFIXES.items():
+            if encoding == "br" and brotli is None:
+                continue
+            prebuilt = path.with_name(path.name + suffix)
+            if prebuilt.exists() and prebuilt.stat().st_mtime >= mtime:
+                self.bodies[encoding] = prebuilt.read_bytes()
+            else:
+                self.bodies[encoding] = _compress(raw, encoding, build=False)
+
+    def _encoding(self, accept: str) -> str:
+        offered = {part.split(";")[0].strip() for part in accept.split(",")}
+        for encoding in ("br", "gzip"):
+            if encoding in offered and encoding in self.bodies:
+                return encoding
+        return "identity"
+
+    def response(self, request: Request) -> Response:
+        encoding = self._encoding(request.headers.get("accept-encoding", ""))
+        etag = self.etags[encoding]
+        headers = {"ETag": etag, "Cache-Control": self.cache_control, "Vary": "Accept-Encoding"}
+        inm = request.headers.get("if-none-match", "")
+        if any(tag.strip().removeprefix("W/") == etag for tag in inm.split(",")):
+            return Response(status_code=304, headers=headers)
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        return Response(self.bodies[encoding], media_type=self.media_type, headers=headers)
+
+_oauth_page = StaticAsset(STATIC_DIR / "oauth.html", "text/html; charset=utf-8")
+
+@router.get("/oauth", include_in_schema=False)
+def oauth_ui(request: Request):
+    """OAuth management UI; all dynamic data comes from /oauth/google/status"""
+    return _oauth_page.response(request)
+
+static_files = StaticFiles(directory=STATIC_DIR)
+
+if __name__ == "__main__":
+    precompress()
@@ -0,0 +1,53 @@
+"""Local stand-in for Google's OAuth token endpoint.
+
+Answers both authorization_code and refresh_token grants with a fresh
+access token after an optional delay, and counts the calls it served so
+benchmarks can check refresh coalescing.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+class FakeGoogle:
+    def __init__(self, latency: float = 0.05, expires_in: int = 3600):
+        self.latency = latency
+        self.expires_in = expires_in
+        self.calls = 0
+        self._lock = threading.Lock()
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                form = parse_qs(self.rfile.read(int(self.headers.get("content-length", 0))).decode())
+                with fake._lock:
+                    fake.calls += 1
+                    n = fake.calls
+                time.sleep(fake.latency)
+                tok = {"access_token": f"fake-at-{n}", "expires_in": fake.expires_in, "token_type": "Bearer", "scope": "openid"}
+                if form.get("grant_type") == ["authorization_code"]:
+                    tok["refresh_token"] = f"fake-rt-{n}"
+                body = json.dumps(tok).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self._server.server_port}/token"
+
+    def start(self) -> "FakeGoogle":
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,387 @@
+"""Load-test harness for the Home Secrets server.
+
+Starts the FastAPI app from app/main.py under uvicorn in a background
+thread, with its data directory in a temp dir and Google's token endpoint
+replaced by bench/fake_google.py, then drives request mixes against it.
+
+    python bench/run.py                       # every scenario
+    python bench/run.py token_hot expiry_storm -c 32 -n 5000
+    python bench/run.py --json results.json   # also write machine-readable results
+
+Reports p50/p99 latency, throughput and process RSS per scenario. Client and
+server share one process (and GIL), so compare numbers between runs on the
+same board rather than reading them as absolute capacity.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE.parent / "app"))
+sys.path.insert(0, str(HERE))
+
+API_KEY = "bench-key"
+SECRET_KEYS = [f"BENCH_{i}" for i in range(15)]
+STORM_LABELS = [f"storm{i}" for i in range(20)]
+
+def _configure_env(data_dir: str) -> None:
+    os.environ.update(
+        HS_DATA_DIR=data_dir,
+        HS_API_KEY=API_KEY,
+        HS_API_RATE_LIMIT="0",
+        HS_SECRET_PREFIX="HS_",
+        GOOGLE_ENABLED="true",
+        GOOGLE_CLIENT_ID="bench-client",
+        GOOGLE_CLIENT_SECRET="bench-secret",
+        GOOGLE_TOKEN_LABEL="default",
+        # Keep the background refresher out of the way of the storm scenario
+        HS_OAUTH_REFRESH_INTERVAL_SECONDS="3600",
+        HS_OAUTH_REFRESH_JITTER_SECONDS="0",
+    )
+    for key in SECRET_KEYS:
+        os.environ[f"HS_{key}"] = f"value-of-{key.lower()}"
+
+def rss_mb() -> float:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def summarize(name: str, latencies: list[float], elapsed: float, **extra) -> dict:
+    latencies = sorted(latencies)
+    n = len(latencies)
+
+    def pct(p: float) -> float:
+        return latencies[min(n - 1, int(p * n))] * 1000 if n else 0.0
+
+    return {
+        "scenario": name,
+        "requests": n,
+        "p50_ms": round(pct(0.50), 3),
+        "p99_ms": round(pct(0.99), 3),
+        "max_ms": round(latencies[-1] * 1000, 3) if n else 0.0,
+        "rps": round(n / elapsed, 1) if elapsed else 0.0,
+        "rss_mb": round(rss_mb(), 1),
+        **extra,
+    }
+
+async def drive(op, total: int, concurrency: int) -> tuple[list[float], float]:
+    """Run op() total times with at most concurrency in flight; returns latencies and wall time."""
+    latencies: list[float] = []
+    remaining = total
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            start = time.perf_counter()
+            await op()
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, time.perf_counter() - start
+
+class Server:
+    """uvicorn serving main.app on a free port in a daemon thread."""
+
+    def __init__(self, app):
+        import uvicorn
+        self.config = uvicorn.Config(app, host="127.0.0.1", port=0, log_level="warning", lifespan="on", timeout_graceful_shutdown=2)
+        self.server = uvicorn.Server(self.config)
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def start(self) -> str:
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.01)
+        port = self.server.servers[0].sockets[0].getsockname()[1]
+        return f"http://127.0.0.1:{port}"
+
+    def stop(self) -> None:
+        self.server.should_exit = True
+        self.thread.join(5)
+
+# ---- HTTP scenarios -------------------------------------------------------
+
+async def token_hot(ctx, n, c):
+    """Repeated reads of one fresh token: the dashboard polling path."""
+    ctx.storage.token_set("google", "hot", {"access_token": "hot-at", "refresh_token": "rt", "expiry": int(time.time()) + 3600})
+    headers = {"X-API-Key": API_KEY}
+
+    async def op():
+        r = await ctx.client.get("/oauth/google/token", params={"label": "hot"}, headers=headers)
+        assert r.status_code == 200, r.text
+
+    return summarize("token_hot", *await drive(op, n, c))
+
+async def token_revalidate(ctx, n, c):
+    """Same as token_hot but with If-None-Match, i.e. 304 responses."""
+    ctx.storage.token_set("google", "revalidate", {"access_token": "reval-at", "refresh_token": "rt", "expiry": int(time.time()) + 3600})
+    headers = {"X-API-Key": API_KEY}
+    r = await ctx.client.get("/oauth/google/token", params={"label": "revalidate"}, headers=headers)
+    assert r.status_code == 200, r.text
+    headers["If-None-Match"] = r.headers["etag"]
+
+    async def op():
+        r = await ctx.client.get("/oauth/google/token", params={"label": "revalidate"}, headers=headers)
+        assert r.status_code == 304, r.status_code
+
+    return summarize("token_revalidate", *await drive(op, n, c))
+
+async def expiry_storm(ctx, n, c):
+    """Every label expires at once while clients hammer them; upstream calls should equal labels."""
+    for label in STORM_LABELS:
+        ctx.storage.token_set("google", label, {"access_token": "stale", "refresh_token": "rt", "expiry": 0})
+    before = ctx.google.calls
+    headers = {"X-API-Key": API_KEY}
+    i = 0
+
+    async def op():
+        nonlocal i
+        label = STORM_LABELS[i % len(STORM_LABELS)]
+        i += 1
+        r = await ctx.client.get("/oauth/google/token", params={"label": label}, headers=headers)
+        assert r.status_code == 200, r.text
+
+    result = summarize("expiry_storm", *await drive(op, n, c))
+    result["upstream_calls"] = ctx.google.calls - before
+    result["labels"] = len(STORM_LABELS)
+    return result
+
+async def secret_fanout(ctx, n, c):
+    """An app starting up and fetching 15 secrets one request at a time."""
+    headers = {"X-API-Key": API_KEY}
+
+    async def op():
+        for key in SECRET_KEYS:
+            r = await ctx.client.get(f"/secret/{key}", headers=headers)
+            assert r.status_code == 200, r.text
+
+    return summarize("secret_fanout", *await drive(op, max(1, n // len(SECRET_KEYS)), c), secrets_per_op=len(SECRET_KEYS))
+
+async def secret_bulk(ctx, n, c):
+    """The same 15 secrets through one /secrets call."""
+    headers = {"X-API-Key": API_KEY}
+    params = {"keys": ",".join(SECRET_KEYS)}
+
+    async def op():
+        r = await ctx.client.get("/secrets", params=params, headers=headers)
+        assert r.status_code == 200 and not r.json()["missing"], r.text
+
+    return summarize("secret_bulk", *await drive(op, max(1, n // len(SECRET_KEYS)), c), secrets_per_op=len(SECRET_KEYS))
+
+async def oauth_cycle(ctx, n, c):
+    """/oauth/google/start followed by the callback Google would make."""
+    headers = {"X-API-Key": API_KEY}
+    from urllib.parse import parse_qs, urlsplit
+
+    async def op():
+        r = await ctx.client.get("/oauth/google/start", params={"redirect_uri": "http://bench/cb"}, headers=headers)
+        state = parse_qs(urlsplit(r.json()["authorize_url"]).query)["state"][0]
+        r = await ctx.client.get("/oauth/google/callback", params={"code": "bench-code", "state": state})
+        assert r.status_code == 200, r.text
+
+    return summarize("oauth_cycle", *await drive(op, max(1, n // 10), c))
+
+HTTP_SCENARIOS = {f.__name__: f for f in (token_hot, token_revalidate, expiry_storm, secret_fanout, secret_bulk, oauth_cycle)}
+
+# ---- In-process microbenchmarks --------------------------------------------
+
+def _timeit(name: str, fn, n: int, **extra) -> dict:
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(n):
+        t = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - t)
+    result = summarize(name, latencies, time.perf_counter() - start, **extra)
+    result["mean_us"] = round(sum(latencies) / len(latencies) * 1e6, 2)
+    return result
+
+def storage_micro(ctx, n):
+    """Token lookups and writes: re-parsing the file every call (old path) vs each backend, plain and encrypted."""
+    import storage
+    tmp = Path(tempfile.mkdtemp(prefix="hs-bench-storage-"))
+    payload = {"access_token": "x" * 180, "refresh_token": "y" * 100, "scope": "openid", "expiry": 2**31}
+    labels = {f"label{i}": dict(payload) for i in range(10)}
+    json_path = tmp / "google_tokens.json"
+    json_path.write_text(json.dumps(labels, indent=2))
+    cache = storage.JsonBackend(json_path)
+    sqlite = storage.SqliteBackend(tmp / "tokens.db")
+    journal = storage.JournalBackend(tmp / "tokens.journal")
+    for label, entry in labels.items():
+        sqlite.set(label, entry)
+        journal.set(label, entry)
+    results = [
+        _timeit("storage_file_per_call", lambda: storage._read_json(json_path).get("label3"), n),
+        _timeit("storage_json_cache", lambda: cache.get("label3"), n),
+        _timeit("storage_sqlite", lambda: sqlite.get("label3"), n),
+        _timeit("storage_journal", lambda: journal.get("label3"), n),
+    ]
+    # Writes touch the disk, so time fewer of them
+    writes = max(1, n // 20)
+    for name, backend in (("json", cache), ("sqlite", sqlite), ("journal", journal)):
+        results.append(_timeit(f"storage_{name}_set", lambda: backend.set("label3", payload), writes))
+    try:
+        key = storage.derive_key("bench-passphrase", tmp / "storage.salt")
+        enc_path = tmp / "encrypted.json"
+        enc_path.write_text(json.dumps(labels))
+        encrypted = storage.EncryptedBackend(storage.JsonBackend(enc_path), key)
+        uncached = storage.EncryptedBackend(storage.JsonBackend(enc_path), key, cache_size=0)
+    except RuntimeError as e:
+        print(f"skipping encrypted storage benchmarks: {e}", file=sys.stderr)
+        return results
+    results.append(_timeit("storage_json_encrypted", lambda: encrypted.get("label3"), n))
+    results.append(_timeit("storage_json_encrypted_nocache", lambda: uncached.get("label3"), n))
+    return results
+
+def _increment(kind: str, path: str, count: int, results) -> None:
+    """Worker process: read-modify-write one counter label count times."""
+    import storage
+    backend = storage.SqliteBackend(Path(path)) if kind == "sqlite" else storage.JsonBackend(Path(path))
+    latencies = []
+    for _ in range(count):
+        t = time.perf_counter()
+        backend.update("counter", lambda entry: {"n": (entry or {}).get("n", 0) + 1})
+        latencies.append(time.perf_counter() - t)
+    results.put(latencies)
+
+def processes_micro(ctx, n, workers: int = 4):
+    """Several processes updating one label at once: lost updates and throughput, JSON vs SQLite."""
+    import multiprocessing
+    import storage
+    tmp = Path(tempfile.mkdtemp(prefix="hs-bench-processes-"))
+    per_worker = max(10, n // (workers * 20))
+    total = per_worker * workers
+    results = []
+    for kind, path in (("json", tmp / "tokens.json"), ("sqlite", tmp / "tokens.db")):
+        queue = multiprocessing.Queue()
+        procs = [
+            multiprocessing.Process(target=_increment, args=(kind, str(path), per_worker, queue))
+            for _ in range(workers)
+        ]
+        start = time.perf_counter()
+        for proc in procs:
+            proc.start()
+        latencies = [lat for _ in procs for lat in queue.get()]
+        elapsed = time.perf_counter() - start
+        for proc in procs:
+            proc.join()
+        backend = storage.SqliteBackend(path) if kind == "sqlite" else storage.JsonBackend(path)
+        kept = (backend.get("counter") or {}).get("n", 0)
+        results.append(summarize(f"storage_{kind}_{workers}proc", latencies, elapsed, lost_updates=total - kept))
+    return results
+
+def metrics_micro(ctx, n):
+    """Per-request cost of MetricsMiddleware around a trivial ASGI app."""
+    import metrics
+
+    async def endpoint(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def noop_send(message):
+        pass
+
+    class FakeApp:
+        routes = []
+
+    scope = {"type": "http", "method": "GET", "app": FakeApp, "endpoint": endpoint}
+    wrapped = metrics.MetricsMiddleware(endpoint)
+    loop = asyncio.new_event_loop()
+    was = metrics.ENABLED
+    try:
+        bare = _timeit("asgi_bare", lambda: loop.run_until_complete(endpoint(scope, None, noop_send)), n)
+        metrics.ENABLED = True
+        on = _timeit("asgi_metrics_middleware", lambda: loop.run_until_complete(wrapped(scope, None, noop_send)), n)
+    finally:
+        metrics.ENABLED = was
+        loop.close()
+    on["overhead_us"] = round(on["mean_us"] - bare["mean_us"], 2)
+    return [bare, on]
+
+MICRO_SCENARIOS = {"storage": storage_micro, "processes": processes_micro, "metrics": metrics_micro}
+
+# ---- Runner ----------------------------------------------------------------
+
+class Context:
+    pass
+
+async def run_http(names: list[str], n: int, c: int) -> list[dict]:
+    import httpx
+    from fake_google import FakeGoogle
+    import main
+    import oauth_providers
+    import storage
+
+    # main configures INFO logging; per-request client logs would drown the report
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    ctx = Context()
+    ctx.storage = storage
+    ctx.google = FakeGoogle(latency=0.05).start()
+    oauth_providers.providers["google"].token_url = ctx.google.url
+    server = Server(main.app)
+    base_url = server.start()
+    results = []
+    try:
+        limits = httpx.Limits(max_connections=c, max_keepalive_connections=c)
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+            ctx.client = client
+            for name in names:
+                results.append(await HTTP_SCENARIOS[name](ctx, n, c))
+    finally:
+        server.stop()
+        ctx.google.stop()
+    return results
+
+def print_table(results: list[dict]) -> None:
+    cols = ["scenario", "requests", "p50_ms", "p99_ms", "rps", "rss_mb"]
+    print("  ".join(f"{col:>24}" if i == 0 else f"{col:>10}" for i, col in enumerate(cols)) + "  extra")
+    for r in results:
+        extra = {k: v for k, v in r.items() if k not in cols and k != "max_ms"}
+        row = "  ".join(f"{r[col]:>24}" if i == 0 else f"{r[col]:>10}" for i, col in enumerate(cols))
+        print(f"{row}  {json.dumps(extra) if extra else ''}")
+
+def main_cli(argv: list[str] | None = None) -> int:
+    all_names = list(HTTP_SCENARIOS) + list(MICRO_SCENARIOS)
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("scenarios", nargs="*", metavar="SCENARIO", help=f"any of {', '.join(all_names)} (default: all)")
+    parser.add_argument("-n", "--requests", type=int, default=2000, help="requests per HTTP scenario")
+    parser.add_argument("-c", "--concurrency", type=int, default=16)
+    parser.add_argument("--micro-iterations", type=int, default=20000)
+    parser.add_argument("--json", metavar="PATH", help="write results as JSON")
+    args = parser.parse_args(argv)
+    names = args.scenarios or all_names
+    unknown = set(names) - set(all_names)
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(sorted(unknown))}")
+
+    _configure_env(tempfile.mkdtemp(prefix="hs-bench-"))
+    results = []
+    for name in names:
+        if name in MICRO_SCENARIOS:
+            results.extend(MICRO_SCENARIOS[name](None, args.micro_iterations))
+    http_names = [name for name in names if name in HTTP_SCENARIOS]
+    if http_names:
+        results.extend(asyncio.run(run_http(http_names, args.requests, args.concurrency)))
+
+    print_table(results)
+    if args.json:
+        Path(args.json).write_text(json.dumps({"argv": sys.argv[1:], "results": results}, indent=2))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
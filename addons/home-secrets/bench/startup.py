@@ -0,0 +1,100 @@
+"""Startup-time check for the add-on.
+
+Measures, in fresh interpreters, how long `import main` takes and how long
+uvicorn needs until /healthz answers, with Google OAuth enabled and
+disabled. Exits non-zero if the median time-to-ready exceeds the budget, so
+it can gate a release on the target boards.
+
+    python bench/startup.py                    # default 2500 ms budget
+    python bench/startup.py --budget-ms 4000 --runs 7
+    python bench/startup.py --importtime       # also list the slowest imports
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from pathlib import Path
+
+APP_DIR = Path(__file__).resolve().parent.parent / "app"
+
+def _env(google: bool, data_dir: str) -> dict:
+    return {
+        **os.environ,
+        "HS_DATA_DIR": data_dir,
+        "HS_API_KEY": "startup-check",
+        "GOOGLE_ENABLED": "true" if google else "false",
+    }
+
+def import_ms(env: dict) -> float:
+    code = "import time; t = time.perf_counter(); import main; print((time.perf_counter() - t) * 1000)"
+    out = subprocess.run([sys.executable, "-c", code], cwd=APP_DIR, env=env, capture_output=True, text=True, check=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def ready_ms(env: dict, timeout: float = 60) -> float:
+    port = _free_port()
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=APP_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/healthz", timeout=1) as r:
+                    if r.status == 200:
+                        return (time.perf_counter() - start) * 1000
+            except OSError:
+                time.sleep(0.01)
+        raise TimeoutError("server did not become ready")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+def slowest_imports(env: dict, top: int = 15) -> list[tuple[int, str]]:
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"], cwd=APP_DIR, env=env, capture_output=True, text=True, check=True)
+    rows = []
+    for line in out.stderr.splitlines():
+        # "import time:  self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|", 2)
+        rows.append((int(cumulative), name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv("HS_STARTUP_BUDGET_MS", "2500")))
+    parser.add_argument("--importtime", action="store_true", help="list the slowest imports")
+    args = parser.parse_args(argv)
+
+    data_dir = tempfile.mkdtemp(prefix="hs-startup-")
+    over_budget = False
+    for google in (True, False):
+        env = _env(google, data_dir)
+        imports = [import_ms(env) for _ in range(args.runs)]
+        ready = [ready_ms(env) for _ in range(args.runs)]
+        median_ready = statistics.median(ready)
+        verdict = "ok" if median_ready <= args.budget_ms else "OVER BUDGET"
+        over_budget |= median_ready > args.budget_ms
+        print(
+            f"google={'on ' if google else 'off'}  import main: {statistics.median(imports):7.1f} ms"
+            f"  ready (/healthz): {median_ready:7.1f} ms  budget {args.budget_ms:.0f} ms  {verdict}"
+        )
+        if args.importtime:
+            for cumulative, name in slowest_imports(env):
+                print(f"    {cumulative / 1000:8.1f} ms  {name}")
+    return 1 if over_budget else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
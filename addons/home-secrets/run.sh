@@ -55,14 +55,37 @@ export GOOGLE_SCOPES=$(bashio::config 'google.scopes|join( )')
 export GOOGLE_REDIRECT_BASE=$(bashio::config 'google.redirect_base')
 export GOOGLE_TOKEN_LABEL=$(bashio::config 'google.token_label')
 
+# Background refresh lead, shared by every provider
+export HS_OAUTH_REFRESH_LEAD_SECONDS=$(bashio::config 'oauth_refresh_lead_seconds')
+
+# Microsoft / GitHub OAuth config
+export MICROSOFT_ENABLED=$(bashio::config 'microsoft.enabled')
+export MICROSOFT_CLIENT_ID=$(bashio::config 'microsoft.client_id')
+export MICROSOFT_CLIENT_SECRET=$(bashio::config 'microsoft.client_secret')
+export MICROSOFT_TENANT=$(bashio::config 'microsoft.tenant')
+export MICROSOFT_SCOPES=$(bashio::config 'microsoft.scopes|join( )')
+export MICROSOFT_TOKEN_LABEL=$(bashio::config 'microsoft.token_label')
+export GITHUB_ENABLED=$(bashio::config 'github.enabled')
+export GITHUB_CLIENT_ID=$(bashio::config 'github.client_id')
+export GITHUB_CLIENT_SECRET=$(bashio::config 'github.client_secret')
+export GITHUB_SCOPES=$(bashio::config 'github.scopes|join( )')
+export GITHUB_TOKEN_LABEL=$(bashio::config 'github.token_label')
+
 # Server config exposed as env
 export HS_API_KEY="${API_KEY}"
+# bashio prints arrays one object per line; the server needs a single JSON list
+export HS_API_KEYS=$(jq -c '.api_keys // []' /data/options.json)
+export HS_API_RATE_LIMIT=$(bashio::config 'api_rate_limit')
 export HS_SECRET_PREFIX="${SECRET_PREFIX}"
 export HS_CORS_ALLOWED_ORIGINS="${CORS_ORIGINS}"
+export HS_STORAGE_BACKEND=$(bashio::config 'storage_backend')
+# Deliberately outside the HS_ secret namespace
+export HOME_SECRETS_ENCRYPTION_KEY=$(bashio::config 'storage_encryption_key')
+export HS_METRICS_ENABLED=$(bashio::config 'metrics_enabled')
 
 # Ensure persistent storage for tokens etc.
 mkdir -p /data/hs
 chmod 700 /data/hs
 
 bashio::log.info "Starting Home Secrets Server on :8126"
-exec python3 -m uvicorn app.main:app --host 0.0.0.0 --port 8126
\ No newline at end of file
+exec python3 -m uvicorn app.main:app --host 0.0.0.0 --port 8126 --timeout-graceful-shutdown 2
\ No newline at end of file
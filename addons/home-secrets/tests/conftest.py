@@ -0,0 +1,69 @@
+"""Shared test setup.
+
+The app reads its configuration from the environment when modules are
+imported, so everything is set here before any app module is loaded. Each
+test run gets its own data directory; tests use their own token labels.
+"""
+import asyncio
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "app"))
+sys.path.insert(0, str(ROOT / "bench"))
+
+API_KEY = "test-key"
+
+os.environ.update(
+    HS_DATA_DIR=tempfile.mkdtemp(prefix="hs-tests-"),
+    HS_API_KEY=API_KEY,
+    HS_API_RATE_LIMIT="0",
+    GOOGLE_ENABLED="true",
+    GOOGLE_CLIENT_ID="google-client",
+    GOOGLE_CLIENT_SECRET="google-secret",
+    MICROSOFT_ENABLED="true",
+    MICROSOFT_CLIENT_ID="microsoft-client",
+    MICROSOFT_SCOPES="offline_access User.Read",
+    GITHUB_ENABLED="true",
+    GITHUB_CLIENT_ID="github-client",
+)
+
+import httpx  # noqa: E402
+from fake_google import FakeGoogle  # noqa: E402
+import main  # noqa: E402
+import oauth_engine  # noqa: E402
+from oauth_providers import providers  # noqa: E402
+
+@pytest.fixture(autouse=True)
+def _reset_engine():
+    yield
+    oauth_engine._negative.clear()
+    oauth_engine._breakers.clear()
+
+@pytest.fixture
+def stub():
+    """bench/fake_google.py standing in for every provider's token endpoint."""
+    fake = FakeGoogle(latency=0.05).start()
+    saved = {name: p.token_url for name, p in providers.items()}
+    for p in providers.values():
+        p.token_url = fake.url
+    yield fake
+    for name, url in saved.items():
+        providers[name].token_url = url
+    fake.stop()
+
+def run_app(fn):
+    """Run the coroutine fn(client) against the app on a fresh event loop."""
+    async def go():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test", headers={"X-API-Key": API_KEY}) as client:
+            try:
+                return await fn(client)
+            finally:
+                # The pooled client is bound to this loop
+                await oauth_engine.close_client()
+    return asyncio.run(go())
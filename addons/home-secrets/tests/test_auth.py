@@ -0,0 +1,79 @@
+import json
+
+import pytest
+
+import auth
+from conftest import API_KEY, run_app
+
+@pytest.fixture
+def named_keys(monkeypatch):
+    def load(value: str) -> int:
+        monkeypatch.setenv("HS_API_KEYS", value)
+        return auth.reload_keys()
+    yield load
+    monkeypatch.undo()
+    auth.reload_keys()
+
+def test_named_key_is_limited_to_its_scopes(named_keys):
+    named_keys(json.dumps([{"name": "dash", "key": "dash-key", "scopes": ["google:default"]}]))
+
+    async def fetch(client):
+        headers = {"X-API-Key": "dash-key"}
+        return (
+            await client.get("/oauth/google/status", headers=headers),
+            await client.get("/oauth/google/status", params={"label": "other"}, headers=headers),
+            await client.get("/secrets", params={"keys": "A"}, headers=headers),
+        )
+
+    own, other, secrets = run_app(fetch)
+    assert own.status_code == 200
+    assert other.status_code == 403
+    assert secrets.status_code == 403
+
+@pytest.mark.parametrize("value", [
+    # What `bashio::config 'api_keys'` prints for two keys: one object per line
+    '{"name":"a","key":"1","scopes":["secrets"]}\n{"name":"b","key":"2","scopes":["secrets"]}',
+    '{"name":"a","key":"1","scopes":["secrets"]}',
+    '["not-an-object"]',
+])
+def test_malformed_keys_fail_loudly(named_keys, value):
+    with pytest.raises(RuntimeError, match="HS_API_KEYS"):
+        named_keys(value)
+
+def test_keys_are_unlimited_unless_configured(named_keys, monkeypatch):
+    monkeypatch.delenv("HS_API_RATE_LIMIT")
+    named_keys(json.dumps([
+        {"name": "free", "key": "free-key", "scopes": ["secrets"]},
+        {"name": "capped", "key": "capped-key", "scopes": ["secrets"], "rate_limit": 1, "burst": 2},
+    ]))
+    for _ in range(500):
+        auth.require_api_key(API_KEY)
+        auth.require_api_key("free-key", "secrets")
+    auth.require_api_key("capped-key", "secrets")
+    auth.require_api_key("capped-key", "secrets")
+    with pytest.raises(auth.HTTPException) as e:
+        auth.require_api_key("capped-key", "secrets")
+    assert e.value.status_code == 429
+
+def test_metrics_need_a_key_with_the_metrics_scope(named_keys):
+    import asyncio
+    import httpx
+    from fastapi import FastAPI
+    import metrics
+
+    named_keys(json.dumps([
+        {"name": "prometheus", "key": "prom-key", "scopes": ["metrics"]},
+        {"name": "dash", "key": "dash-key", "scopes": ["google:*"]},
+    ]))
+    # Metrics are off in the test environment, so mount the router on its own
+    app = FastAPI()
+    app.include_router(metrics.router)
+
+    async def fetch():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            return [
+                (await client.get("/metrics", headers=headers)).status_code
+                for headers in ({}, {"X-API-Key": "dash-key"}, {"X-API-Key": "prom-key"}, {"X-API-Key": API_KEY})
+            ]
+
+    assert asyncio.run(fetch()) == [403, 403, 200, 200]
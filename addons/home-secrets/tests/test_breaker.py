@@ -0,0 +1,51 @@
+import time
+
+import oauth_engine
+import storage
+from conftest import run_app
+from oauth_providers import providers
+
+def _token(label):
+    async def fetch(client):
+        return await client.get("/oauth/google/token", params={"label": label})
+    return run_app(fetch)
+
+def test_negative_cache_is_bounded(monkeypatch):
+    monkeypatch.setattr(oauth_engine, "NEGATIVE_MAX_ENTRIES", 50)
+
+    async def probe(client):
+        for i in range(200):
+            await client.get("/oauth/google/token", params={"label": f"unknown{i}"})
+
+    run_app(probe)
+    assert len(oauth_engine._negative) == 50
+
+def test_negative_cache_drops_expired_entries(monkeypatch):
+    monkeypatch.setattr(oauth_engine, "NEGATIVE_TTL_SECONDS", 0)
+
+    async def probe(client):
+        for i in range(20):
+            await client.get("/oauth/google/token", params={"label": f"gone{i}"})
+
+    run_app(probe)
+    assert len(oauth_engine._negative) <= 1
+
+def test_stored_tokens_clear_a_cached_404(stub):
+    assert _token("late").status_code == 404
+    storage.token_set("google", "late", {"access_token": "at", "refresh_token": "rt", "expiry": int(time.time()) + 3600})
+    assert _token("late").status_code == 200
+
+def test_breaker_opens_after_repeated_failures(monkeypatch):
+    # Nothing listens on port 1, so every refresh fails with a network error
+    monkeypatch.setattr(providers["google"], "token_url", "http://127.0.0.1:1/token")
+    storage.token_set("google", "down", {"access_token": "stale", "refresh_token": "rt", "expiry": 0})
+
+    async def probe(client):
+        return [
+            (await client.get("/oauth/google/token", params={"label": "down"})).status_code
+            for _ in range(oauth_engine.BREAKER_THRESHOLD + 2)
+        ]
+
+    codes = run_app(probe)
+    assert codes[:oauth_engine.BREAKER_THRESHOLD] == [502] * oauth_engine.BREAKER_THRESHOLD
+    assert codes[oauth_engine.BREAKER_THRESHOLD:] == [503, 503]
@@ -0,0 +1,54 @@
+import pytest
+
+import storage
+from storage import EncryptedBackend, JournalBackend, JsonBackend, SqliteBackend
+
+KEY = b"k" * 32
+
+@pytest.fixture(params=["json", "sqlite", "journal"])
+def inner(request, tmp_path):
+    def make():
+        if request.param == "json":
+            return JsonBackend(tmp_path / "tokens.json")
+        if request.param == "sqlite":
+            return SqliteBackend(tmp_path / "tokens.db")
+        return JournalBackend(tmp_path / "tokens.journal")
+    return make
+
+def test_round_trip(inner):
+    backend = EncryptedBackend(inner(), KEY)
+    backend.set("a", {"access_token": "secret", "refresh_token": "rt"})
+    backend.update("a", lambda entry: {**entry, "access_token": "rotated"})
+
+    raw = inner().get("a")
+    assert list(raw) == ["enc"]
+    assert "rotated" not in raw["enc"]
+    # A fresh instance has an empty cache and has to decrypt
+    assert EncryptedBackend(inner(), KEY).get("a") == {"access_token": "rotated", "refresh_token": "rt"}
+
+def test_wrong_key_fails(inner):
+    EncryptedBackend(inner(), KEY).set("a", {"access_token": "secret"})
+    with pytest.raises(RuntimeError, match="wrong storage_encryption_key"):
+        EncryptedBackend(inner(), b"x" * 32)
+
+def test_plaintext_entries_are_encrypted_on_first_start(inner):
+    inner().set("a", {"access_token": "plain"})
+    backend = EncryptedBackend(inner(), KEY)
+    assert "enc" in inner().get("a")
+    assert backend.get("a") == {"access_token": "plain"}
+
+def test_entry_swapped_between_labels_is_rejected(inner):
+    EncryptedBackend(inner(), KEY).set("a", {"access_token": "for-a"})
+    raw = inner()
+    raw.set("b", raw.get("a"))
+    with pytest.raises(RuntimeError, match="'b'"):
+        EncryptedBackend(inner(), KEY)
+
+def test_missing_key_refuses_sealed_tokens(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "BASE", tmp_path)
+    monkeypatch.setenv("HS_STORAGE_BACKEND", "json")
+    EncryptedBackend(JsonBackend(tmp_path / "github_tokens.json"), KEY).set("a", {"access_token": "secret"})
+
+    monkeypatch.delenv("HOME_SECRETS_ENCRYPTION_KEY", raising=False)
+    with pytest.raises(RuntimeError, match="no storage_encryption_key"):
+        storage._make_backend("github")
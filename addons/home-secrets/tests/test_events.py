@@ -0,0 +1,78 @@
+import asyncio
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import httpx
+
+from conftest import API_KEY, ROOT
+from events import TokenEvents
+
+def test_close_ends_open_streams():
+    events = TokenEvents()
+
+    async def go():
+        frames = []
+
+        async def read():
+            async for frame in events.subscribe("google", None):
+                frames.append(frame)
+
+        reader = asyncio.create_task(read())
+        await asyncio.sleep(0.05)
+        events.publish("google", "default", {"access_token": "at", "expiry": 1})
+        await asyncio.sleep(0.05)
+        events.close()
+        await asyncio.wait_for(reader, timeout=1)
+        return frames
+
+    frames = asyncio.run(go())
+    assert frames[0] == ": connected\n\n"
+    assert frames[1].startswith("event: token\n")
+    assert len(events) == 0
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def test_server_shuts_down_with_a_stream_open():
+    port = _free_port()
+    url = f"http://127.0.0.1:{port}"
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT / "app",
+        env=os.environ,
+    )
+    try:
+        for _ in range(100):
+            try:
+                httpx.get(f"{url}/healthz")
+                break
+            except httpx.TransportError:
+                time.sleep(0.1)
+
+        connected = threading.Event()
+        ended = threading.Event()
+
+        def listen():
+            with httpx.stream("GET", f"{url}/oauth/google/events", headers={"X-API-Key": API_KEY}, timeout=None) as r:
+                for line in r.iter_lines():
+                    connected.set()
+            ended.set()
+
+        threading.Thread(target=listen, daemon=True).start()
+        assert connected.wait(5)
+
+        start = time.monotonic()
+        server.send_signal(signal.SIGTERM)
+        # uvicorn re-raises the signal once it has shut down cleanly
+        server.wait(timeout=5)
+        assert time.monotonic() - start < 1
+        assert ended.wait(1)
+    finally:
+        server.kill()
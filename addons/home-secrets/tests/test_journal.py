@@ -0,0 +1,68 @@
+import json
+import time
+
+from storage import JournalBackend
+
+def _record(label, payload):
+    return json.dumps({"l": label, "p": payload}, separators=(",", ":")).encode() + b"\n"
+
+def test_replay_after_set_update_and_delete(tmp_path):
+    path = tmp_path / "t.journal"
+    journal = JournalBackend(path)
+    for i in range(3):
+        journal.set(f"l{i}", {"access_token": f"a{i}"})
+    journal.update("l0", lambda entry: {**entry, "access_token": "new"})
+    assert journal.delete("l2")
+    assert not journal.delete("missing")
+
+    replayed = JournalBackend(path)
+    assert sorted(replayed.labels()) == ["l0", "l1"]
+    assert replayed.get("l0") == {"access_token": "new"}
+    assert replayed.get("l2") is None
+
+def test_torn_last_record_is_truncated(tmp_path):
+    path = tmp_path / "t.journal"
+    JournalBackend(path).set("kept", {"access_token": "a"})
+    good = path.stat().st_size
+    with open(path, "ab") as f:
+        f.write(_record("torn", {"access_token": "b"})[:15])
+
+    journal = JournalBackend(path)
+    assert journal.labels() == ["kept"]
+    assert path.stat().st_size == good
+    # New writes land after the last complete record and survive a restart
+    journal.set("after", {"access_token": "c"})
+    assert sorted(JournalBackend(path).labels()) == ["after", "kept"]
+
+def test_garbage_line_in_the_middle_is_skipped(tmp_path):
+    path = tmp_path / "t.journal"
+    path.write_bytes(_record("a", {"n": 1}) + b"not json\n" + b'{"x":1}\n' + _record("b", {"n": 2}))
+    journal = JournalBackend(path)
+    assert journal.get("a") == {"n": 1}
+    assert journal.get("b") == {"n": 2}
+
+def test_compaction_under_churn(tmp_path):
+    path = tmp_path / "t.journal"
+    journal = JournalBackend(path, compact_bytes=4096)
+    journal.set("steady", {"access_token": "s"})
+    for i in range(500):
+        journal.set("hot", {"access_token": "x" * 50, "n": i})
+    deadline = time.time() + 5
+    while path.stat().st_size > 4096 + 200 and time.time() < deadline:
+        time.sleep(0.01)
+    assert path.stat().st_size <= 4096 + 200
+
+    replayed = JournalBackend(path)
+    assert replayed.get("hot")["n"] == 499
+    assert replayed.get("steady") == {"access_token": "s"}
+
+def test_json_file_is_migrated_once(tmp_path):
+    legacy = tmp_path / "google_tokens.json"
+    legacy.write_text(json.dumps({"a": {"access_token": "1"}, "__state__": {"x": {}}}))
+    path = tmp_path / "google_tokens.journal"
+
+    journal = JournalBackend(path, migrate_from=legacy)
+    assert journal.labels() == ["a"]
+    assert not legacy.exists()
+    assert (tmp_path / "google_tokens.json.migrated").exists()
+    assert JournalBackend(path, migrate_from=legacy).get("a") == {"access_token": "1"}
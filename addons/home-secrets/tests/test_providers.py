@@ -0,0 +1,71 @@
+import asyncio
+from urllib.parse import parse_qs, urlparse
+
+import storage
+from conftest import run_app
+
+async def _login(client, provider: str) -> dict:
+    r = await client.get(f"/oauth/{provider}/start", params={"redirect_uri": "http://app/cb"})
+    state = parse_qs(urlparse(r.json()["authorize_url"]).query)["state"][0]
+    r = await client.get(f"/oauth/{provider}/callback", params={"code": "code", "state": state})
+    assert r.status_code == 200, r.text
+    return r.json()
+
+def test_github_token_without_expiry(stub):
+    stub.expires_in = 0  # GitHub OAuth app tokens carry no expires_in
+
+    async def flow(client):
+        await _login(client, "github")
+        return (
+            await client.get("/oauth/github/token"),
+            await client.get("/oauth/github/status"),
+        )
+
+    token, status = run_app(flow)
+    assert token.json()["expiry"] is None
+    assert token.headers["cache-control"] == "max-age=300"
+    assert status.json()["status"] == "ok"
+    assert status.json()["is_expired"] is False
+    # Later requests are served from storage
+    assert stub.calls == 1
+
+def test_microsoft_refresh_storm_makes_one_upstream_call(stub):
+    async def flow(client):
+        await _login(client, "microsoft")
+        storage.token_update("microsoft", "default", lambda entry: {**entry, "expiry": 0})
+        before = stub.calls
+        responses = await asyncio.gather(*(client.get("/oauth/microsoft/token") for _ in range(30)))
+        return responses, stub.calls - before
+
+    responses, upstream = run_app(flow)
+    assert {r.status_code for r in responses} == {200}
+    assert upstream == 1
+
+def test_providers_keep_separate_token_stores(stub):
+    async def flow(client):
+        await _login(client, "github")
+        storage.token_delete("microsoft", "default")
+        return await client.get("/oauth/microsoft/status")
+
+    assert run_app(flow).json()["status"] == "no_token"
+    assert storage.token_get("github", "default")["access_token"]
+
+def test_state_from_another_provider_is_rejected(stub):
+    async def flow(client):
+        r = await client.get("/oauth/github/start", params={"redirect_uri": "http://app/cb"})
+        state = parse_qs(urlparse(r.json()["authorize_url"]).query)["state"][0]
+        return await client.get("/oauth/microsoft/callback", params={"code": "code", "state": state})
+
+    r = run_app(flow)
+    assert r.status_code == 400
+    assert stub.calls == 0
+
+def test_unknown_provider_is_404():
+    async def flow(client):
+        return [
+            (await client.get("/oauth/nope/token")).status_code,
+            (await client.get("/oauth/nope/start", params={"redirect_uri": "http://app/cb"})).status_code,
+            (await client.get("/oauth/nope/status")).status_code,
+        ]
+
+    assert run_app(flow) == [404, 404, 404]
@@ -0,0 +1,62 @@
+import asyncio
+import time
+
+import storage
+from conftest import run_app
+
+def test_concurrent_requests_share_one_refresh(stub):
+    storage.token_set("google", "storm", {"access_token": "stale", "refresh_token": "rt", "expiry": 0})
+
+    async def storm(client):
+        return await asyncio.gather(*(
+            client.get("/oauth/google/token", params={"label": "storm"}) for _ in range(50)
+        ))
+
+    responses = run_app(storm)
+    assert {r.status_code for r in responses} == {200}
+    assert len({r.json()["access_token"] for r in responses}) == 1
+    assert stub.calls == 1
+
+def test_fresh_token_is_served_without_upstream_call(stub):
+    storage.token_set("google", "fresh", {"access_token": "at", "refresh_token": "rt", "expiry": int(time.time()) + 3600})
+
+    async def fetch(client):
+        return await client.get("/oauth/google/token", params={"label": "fresh"})
+
+    assert run_app(fetch).json()["access_token"] == "at"
+    assert stub.calls == 0
+
+def test_forced_stale_expiry_is_not_recorded_as_lead(stub):
+    from oauth_providers import providers
+    from refresher import Refresher
+
+    storage.token_set("google", "forced", {"access_token": "stale", "refresh_token": "rt", "expiry": 0})
+    r = Refresher(lead=300, jitter=0, interval=15, max_backoff=900)
+
+    async def refresh(client):
+        await r._refresh(providers["google"], "forced", storage.token_get("google", "forced"), r._state("google", "forced"))
+
+    run_app(refresh)
+    assert r.stats["refreshes"] == 1
+    assert r.stats["min_lead_seconds"] is None
+    assert r.stats["lead_seconds_sum"] == 0
+
+def test_waiters_of_a_cancelled_flight_start_a_new_one():
+    from oauth_engine import _single_flight
+    calls = []
+
+    async def fn():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return len(calls)
+
+    async def go():
+        leader = asyncio.create_task(_single_flight("cancelled", fn))
+        await asyncio.sleep(0)
+        waiters = [asyncio.create_task(_single_flight("cancelled", fn)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        return await asyncio.gather(*waiters)
+
+    assert asyncio.run(go()) == [2, 2, 2]
+    assert len(calls) == 2
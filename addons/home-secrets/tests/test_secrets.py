@@ -0,0 +1,82 @@
+import json
+
+import pytest
+
+import secrets_api
+from conftest import run_app
+
+@pytest.fixture
+def options_file(tmp_path, monkeypatch):
+    path = tmp_path / "options.json"
+    monkeypatch.setattr(secrets_api, "OPTIONS_FILE", path)
+    yield path
+    path.unlink(missing_ok=True)
+    secrets_api.reload_secrets()
+
+def _get(key):
+    async def fetch(client):
+        return await client.get(f"/secret/{key}")
+    return run_app(fetch)
+
+def test_reload_picks_up_changed_options(options_file):
+    options_file.write_text(json.dumps({"secret_prefix": "HS_", "extra_env": {"HS_RELOADED": "one"}}))
+
+    async def reload(client):
+        return await client.post("/secrets/reload")
+
+    run_app(reload)
+    assert _get("RELOADED").json()["value"] == "one"
+
+    options_file.write_text(json.dumps({"secret_prefix": "HS_", "extra_env": {"HS_RELOADED": "two", "HS_ADDED": "x"}}))
+    run_app(reload)
+    assert _get("RELOADED").json()["value"] == "two"
+    assert _get("ADDED").json()["value"] == "x"
+
+    options_file.write_text(json.dumps({"secret_prefix": "HS_", "extra_env": {}}))
+    run_app(reload)
+    assert _get("RELOADED").status_code == 404
+
+def test_bulk_lookup_reports_missing(options_file):
+    options_file.write_text(json.dumps({"extra_env": {"HS_BULK_A": "a"}}))
+    secrets_api.reload_secrets()
+
+    async def fetch(client):
+        return await client.get("/secrets", params={"keys": "BULK_A,BULK_B"})
+
+    body = run_app(fetch).json()
+    assert body["secrets"]["BULK_A"]["value"] == "a"
+    assert body["missing"] == ["BULK_B"]
+
+def test_server_settings_are_not_secrets(monkeypatch):
+    monkeypatch.setenv("HS_API_KEYS", '[{"name": "x", "key": "k"}]')
+    monkeypatch.setenv("HOME_SECRETS_ENCRYPTION_KEY", "passphrase")
+    monkeypatch.setenv("HS_API_KEY_OPENAI", "user-secret")
+    secrets_api.reload_secrets()
+
+    async def fetch(client):
+        return await client.get("/secrets", params={"keys": "API_KEY,API_KEYS,STORAGE_BACKEND,DATA_DIR,API_KEY_OPENAI"})
+
+    body = run_app(fetch).json()
+    assert list(body["secrets"]) == ["API_KEY_OPENAI"]
+    assert _get("API_KEY").status_code == 404
+    monkeypatch.undo()
+    secrets_api.reload_secrets()
+
+def test_storage_passphrase_is_never_served(options_file, monkeypatch):
+    monkeypatch.setenv("HOME_SECRETS_ENCRYPTION_KEY", "passphrase")
+    monkeypatch.setenv("HOME_OTHER", "fine")
+    # Even a prefix that covers the passphrase's name doesn't expose it
+    options_file.write_text(json.dumps({"secret_prefix": "HOME_"}))
+    secrets_api.reload_secrets()
+    assert _get("SECRETS_ENCRYPTION_KEY").status_code == 404
+    assert _get("OTHER").json()["value"] == "fine"
+
+def test_only_the_exact_setting_names_are_hidden(options_file, caplog):
+    options_file.write_text(json.dumps({"extra_env": {"HS_OAUTH_CLIENT_SECRET": "mine", "HS_OAUTH_STATE_MAX": "5"}}))
+    secrets_api.reload_secrets()
+    assert _get("OAUTH_CLIENT_SECRET").json()["value"] == "mine"
+    assert _get("OAUTH_STATE_MAX").status_code == 404
+    assert "HS_OAUTH_STATE_MAX is not served" in caplog.text
+
+    options_file.write_text(json.dumps({"extra_env": {}}))
+    secrets_api.reload_secrets()
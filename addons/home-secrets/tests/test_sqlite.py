@@ -0,0 +1,36 @@
+import json
+import multiprocessing
+
+from storage import SqliteBackend
+
+def _increment(path, count):
+    backend = SqliteBackend(path)
+    for _ in range(count):
+        backend.update("counter", lambda entry: {"n": (entry or {}).get("n", 0) + 1})
+
+def test_concurrent_updates_from_several_processes_are_not_lost(tmp_path):
+    path = tmp_path / "tokens.db"
+    workers, count = 4, 50
+    procs = [multiprocessing.Process(target=_increment, args=(path, count)) for _ in range(workers)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join(30)
+        assert p.exitcode == 0
+    assert SqliteBackend(path).get("counter") == {"n": workers * count}
+
+def test_json_file_is_migrated_once(tmp_path):
+    legacy = tmp_path / "google_tokens.json"
+    legacy.write_text(json.dumps({"a": {"access_token": "1"}, "b": {"access_token": "2"}, "__state__": {"x": {}}}))
+    path = tmp_path / "google_tokens.db"
+
+    backend = SqliteBackend(path, migrate_from=legacy)
+    assert sorted(backend.labels()) == ["a", "b"]
+    assert backend.get("b") == {"access_token": "2"}
+    assert not legacy.exists()
+    assert (tmp_path / "google_tokens.json.migrated").exists()
+
+    # A JSON file reappearing later never overwrites rows already in the database
+    backend.set("a", {"access_token": "new"})
+    legacy.write_text(json.dumps({"a": {"access_token": "old"}}))
+    assert SqliteBackend(path, migrate_from=legacy).get("a") == {"access_token": "new"}
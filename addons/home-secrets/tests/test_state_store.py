@@ -0,0 +1,57 @@
+import time
+from urllib.parse import parse_qs, urlparse
+
+import oauth_engine
+import storage
+from conftest import API_KEY, run_app
+from state_store import StateStore, states
+
+def _start() -> str:
+    result = oauth_engine.oauth_start("google", redirect_uri="http://app/cb", x_api_key=API_KEY)
+    return parse_qs(urlparse(result["authorize_url"]).query)["state"][0]
+
+def _lookup_us(rounds: int = 2000) -> float:
+    """Mean cost of a start followed by the callback's state lookup."""
+    t = time.perf_counter()
+    for _ in range(rounds):
+        assert states.pop(_start()) is not None
+    return (time.perf_counter() - t) / rounds * 1e6
+
+def test_start_calls_keep_store_and_token_file_flat():
+    before = storage.GOOGLE_FILE.stat().st_size if storage.GOOGLE_FILE.exists() else 0
+    early = _lookup_us()
+    for _ in range(100_000):
+        _start()
+    assert len(states) <= states.max_size
+    late = _lookup_us()
+    assert late < early * 3 + 20
+    # State never touches the token file
+    after = storage.GOOGLE_FILE.stat().st_size if storage.GOOGLE_FILE.exists() else 0
+    assert after == before
+
+def test_start_route_state_is_single_use():
+    async def flow(client):
+        r = await client.get("/oauth/google/start", params={"redirect_uri": "http://app/cb"})
+        return parse_qs(urlparse(r.json()["authorize_url"]).query)["state"][0]
+
+    state = run_app(flow)
+    assert states.pop(state)["redirect_uri"] == "http://app/cb"
+    assert states.pop(state) is None
+
+def test_persisted_state_file_stays_bounded(tmp_path):
+    path = tmp_path / "oauth_state.json"
+    store = StateStore(ttl=600, max_size=50, persist_path=path)
+    for i in range(200):
+        store.put(f"s{i}", {"label": "default", "redirect_uri": "http://app/cb"})
+    size = path.stat().st_size
+    for i in range(200, 5000):
+        store.put(f"s{i}", {"label": "default", "redirect_uri": "http://app/cb"})
+    assert len(store) == 50
+    assert path.stat().st_size <= size + 100
+
+def test_expired_state_is_rejected():
+    store = StateStore(ttl=60)
+    store.put("old", {"ts": time.time() - 61})
+    store.put("new", {})
+    assert store.pop("old") is None
+    assert store.pop("new") is not None
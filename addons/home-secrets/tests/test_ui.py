@@ -0,0 +1,19 @@
+from conftest import run_app
+
+def _get(headers):
+    async def fetch(client):
+        return await client.get("/oauth", headers=headers)
+    return run_app(fetch)
+
+def test_each_encoding_has_its_own_etag():
+    identity = _get({"Accept-Encoding": "identity"})
+    gzipped = _get({"Accept-Encoding": "gzip"})
+    assert gzipped.headers["content-encoding"] == "gzip"
+    assert identity.headers["etag"] != gzipped.headers["etag"]
+
+def test_revalidation_matches_only_the_same_encoding():
+    etag = _get({"Accept-Encoding": "gzip"}).headers["etag"]
+    assert _get({"Accept-Encoding": "gzip", "If-None-Match": etag}).status_code == 304
+    plain = _get({"Accept-Encoding": "identity", "If-None-Match": etag})
+    assert plain.status_code == 200
+    assert "content-encoding" not in plain.headers